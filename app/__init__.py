@@ -1,13 +1,54 @@
 # app/__init__.py
-from flask import Flask
+import os
+from flask import Flask, session
+from flask_login import LoginManager
+from flask_migrate import Migrate
 from .config import Config
 
+# templates/ and static/ live at the repository root, next to run.py.
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+migrate = Migrate()
+login_manager = LoginManager()
+
 def create_app(config_class=Config):
-    app = Flask(__name__)
+    """
+    Builds the app: config, database, login, the /api blueprint and response
+    handling. run.py creates the one instance (`gunicorn run:app`) and adds the
+    web routes and CLI commands to it.
+    """
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    from . import compression, json_provider
+    from .api_routes import api as api_blueprint, init_api_serializer
+    from .db_engine import engine_options, register_pool_metrics
+    from .db_routing import REPLICA_BIND
+    from .models import db, User, Fixer
+
+    app = Flask(__name__, root_path=ROOT_PATH)
     app.config.from_object(config_class)
+    if app.config.get('TRUSTED_PROXIES'):
+        proxies = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+    if app.config.get('DATABASE_REPLICA_URL'):
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: app.config['DATABASE_REPLICA_URL']}
+    # Pool sizing, pre-ping and recycling from the environment (see app/db_engine.py)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    db.init_app(app)
+    with app.app_context():
+        register_pool_metrics(db.engines)
+    migrate.init_app(app, db)
+    login_manager.init_app(app)
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        if session.get('user_type') == 'fixer': return db.session.get(Fixer, int(user_id))
+        return db.session.get(User, int(user_id))
 
-    # Import and register the main blueprint for routes
-    from app.routes import main as main_blueprint
-    app.register_blueprint(main_blueprint)
+    app.register_blueprint(api_blueprint, url_prefix='/api')
+    init_api_serializer(app.config['SECRET_KEY'])
 
-    return app
\ No newline at end of file
+    # orjson for jsonify (when installed) and compressed responses
+    json_provider.init_app(app)
+    compression.init_app(app)
+    return app
@@ -1,11 +1,25 @@
 # app/api_routes.py
-from flask import Blueprint, request, jsonify
-from .models import db, User, Fixer, Job
+from flask import Blueprint, request, jsonify, g, Response, current_app, session
+from functools import wraps
+import base64
+import json
+import secrets
+from .models import (db, User, Fixer, Job, JobHistory, JOB_HISTORY_COLUMNS, OTP_TTL_MINUTES, SyncRemoval,
+                     record_failed_otp, settled_sync_version)
+from .cache import TTLCache
+from .rate_limit import SlidingWindowLimiter, client_ip, too_many_requests, gcra_limiter_from_environment, hashed_key
+from . import background
 from .services import send_whatsapp_message # We can reuse our existing services
 from flask_login import login_user, logout_user, current_user
 from itsdangerous import URLSafeTimedSerializer
+from datetime import datetime
 import os
 
+try:
+    import orjson
+except ImportError:  # optional: plain json is used without it
+    orjson = None
+
 # Create a new Blueprint for the API
 api = Blueprint('api', __name__)
 
@@ -17,45 +31,319 @@ def init_api_serializer(secret_key):
     global serializer
     serializer = URLSafeTimedSerializer(secret_key)
 
+# --- NEW: API key authentication ---
+# Every mobile request carries its key, so key -> principal lookups are cached
+# per process. Unknown keys are never cached; a rotated or revoked key keeps
+# working for at most API_KEY_CACHE_TTL seconds unless forget_api_key is called.
+API_KEY_CACHE_TTL = int(os.environ.get('API_KEY_CACHE_TTL', '60'))
+_api_principals = TTLCache(maxsize=4096, ttl_seconds=API_KEY_CACHE_TTL)
+
+def _request_api_key():
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        return auth[len('Bearer '):].strip()
+    return request.headers.get('X-API-Key', '').strip()
+
+def lookup_api_key(api_key):
+    """Returns ('client' | 'fixer', id) for an API key, or None."""
+    if not api_key:
+        return None
+    principal = _api_principals.get(api_key)
+    if principal is None:
+        user_id = db.session.scalar(db.select(User.id).where(User.api_key == api_key))
+        if user_id is not None:
+            principal = ('client', user_id)
+        else:
+            fixer_id = db.session.scalar(db.select(Fixer.id).where(Fixer.api_key == api_key))
+            if fixer_id is None:
+                return None
+            principal = ('fixer', fixer_id)
+        _api_principals.set(api_key, principal)
+    return principal
+
+def forget_api_key(api_key):
+    """Drops a key from this process's cache, e.g. after it was rotated."""
+    _api_principals.pop(api_key)
+
+def api_key_required(f):
+    """Rejects requests without a valid API key; sets g.api_user_type and g.api_user_id."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        principal = lookup_api_key(_request_api_key())
+        if principal is None:
+            return jsonify({'error': 'Invalid or missing API key'}), 401
+        g.api_user_type, g.api_user_id = principal
+        return f(*args, **kwargs)
+    return decorated
+
+# --- NEW: Per-client rate limit for the API and the location endpoints ---
+# Keyed by API key once the key is known to be valid (i.e. cached), else by the
+# logged-in session, else by IP. It runs before authentication, so a client
+# stuck in a retry loop, or cycling through made-up keys, is turned away
+# without a database query. The limit applies per gunicorn worker unless
+# RATE_LIMIT_BACKEND=redis, so by default a client gets up to WEB_CONCURRENCY
+# times API_RATE_LIMIT_PER_MINUTE in total.
+API_RATE_LIMIT = gcra_limiter_from_environment(
+    'api',
+    rate=int(os.environ.get('API_RATE_LIMIT_PER_MINUTE', '120')), period=60,
+    burst=int(os.environ.get('API_RATE_LIMIT_BURST', '30')),
+)
+
+def _rate_limit_key():
+    api_key = _request_api_key()
+    if api_key and _api_principals.get(api_key) is not None:
+        return f"key:{hashed_key(api_key)}"
+    if session.get('_user_id'):
+        return f"user:{session.get('user_type', 'client')}:{session['_user_id']}"
+    return f"ip:{client_ip()}"
+
+def check_api_rate_limit():
+    """Returns a 429 response if the caller is over API_RATE_LIMIT, else None."""
+    allowed, retry_after = API_RATE_LIMIT.hit(_rate_limit_key())
+    if not allowed:
+        return too_many_requests(retry_after)
+    return None
+
+def api_rate_limited(f):
+    """Applies API_RATE_LIMIT to a view outside the api blueprint."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        return check_api_rate_limit() or f(*args, **kwargs)
+    return decorated
+
+api.before_request(check_api_rate_limit)
+
+# --- NEW: Serialisation ---
+def _json_default(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)  # Decimal amounts go out as strings, so no precision is lost
+
+def json_response(payload, status=200):
+    """JSON response using orjson when it is installed."""
+    if orjson is not None:
+        body = orjson.dumps(payload, default=_json_default)
+    else:
+        body = json.dumps(payload, default=_json_default, separators=(',', ':'))
+    return Response(body, status=status, mimetype='application/json')
+
+def _encode_cursor(created_at, job_id):
+    raw = f"{created_at.isoformat()}|{job_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, job_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(job_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
 # --- API AUTHENTICATION ROUTES ---
 
+# --- NEW: OTP login ---
+# A code is sent over WhatsApp and exchanged for the account's API key. Both
+# steps are rate limited per phone number and per IP before touching the
+# database, so guessing codes or burning our 360dialog quota is impractical.
+# A code is also discarded after OTP_MAX_ATTEMPTS wrong guesses, whichever
+# worker or IP they came from.
+OTP_REQUEST_PHONE_LIMIT = SlidingWindowLimiter('otp_request_phone', limit=3, window_seconds=600)
+OTP_REQUEST_IP_LIMIT = SlidingWindowLimiter('otp_request_ip', limit=20, window_seconds=3600)
+OTP_VERIFY_PHONE_LIMIT = SlidingWindowLimiter('otp_verify_phone', limit=5, window_seconds=600)
+OTP_VERIFY_IP_LIMIT = SlidingWindowLimiter('otp_verify_ip', limit=30, window_seconds=600)
+
+def normalize_phone(phone_number):
+    """'0821234567', '+27821234567' or 'whatsapp:+27821234567' -> 'whatsapp:+27821234567', else None."""
+    phone = str(phone_number or '').strip().replace(' ', '')
+    if phone.startswith('whatsapp:'):
+        phone = phone[len('whatsapp:'):]
+    if phone.startswith('0') and len(phone) == 10 and phone.isdigit():
+        return f"whatsapp:+27{phone[1:]}"
+    if phone.startswith('+') and len(phone) == 12 and phone[1:].isdigit():
+        return f"whatsapp:{phone}"
+    return None
+
+def _login_request():
+    """Reads and validates phone_number and user_type. Returns (phone, model, error response)."""
+    data = request.get_json(silent=True) or {}
+    user_type = data.get('user_type', 'client')
+    if user_type not in ('client', 'fixer'):
+        return None, None, (jsonify({'error': "user_type must be 'client' or 'fixer'"}), 400)
+    phone = normalize_phone(data.get('phone_number'))
+    if phone is None:
+        return None, None, (jsonify({'error': 'Invalid phone number'}), 400)
+    return phone, (Fixer if user_type == 'fixer' else User), None
+
+def _check_limits(*checks):
+    for limiter, key in checks:
+        allowed, retry_after = limiter.hit(key)
+        if not allowed:
+            return too_many_requests(retry_after)
+    return None
+
+@api.route('/request_otp', methods=['POST'])
 @api.route('/request_login_link', methods=['POST'])
 def api_request_login_link():
     """
-    API endpoint for the mobile app to request a login link.
-    It receives a phone number and user type ('client' or 'fixer').
+    Sends a one-time login code to a registered client or fixer over WhatsApp.
+    The response is the same whether or not the number is registered.
     """
-    data = request.json
-    phone_number = data.get('phone_number')
-    user_type = data.get('user_type', 'client') # Default to client
+    phone, model, error = _login_request()
+    if error:
+        return error
+    limited = _check_limits((OTP_REQUEST_IP_LIMIT, client_ip()), (OTP_REQUEST_PHONE_LIMIT, phone))
+    if limited:
+        return limited
 
-    # Placeholder for logic to generate and send a link via WhatsApp
-    print(f"API: Received login request for {user_type} with number {phone_number}")
+    account = model.query.filter_by(phone_number=phone).first()
+    if account:
+        otp = f"{secrets.randbelow(1000000):06d}"
+        account.set_otp(otp)
+        db.session.commit()
+        background.submit(current_app._get_current_object(), send_whatsapp_message, to_number=phone,
+                          message_body=f"Your FixMate-SA login code is {otp}. It expires in {OTP_TTL_MINUTES} minutes. Never share it with anyone.")
+    return jsonify({'status': 'success', 'message': 'If your number is registered, you will receive a login code via WhatsApp.'})
 
-    # In the next step, we will add the logic here to:
-    # 1. Find the user/fixer in the database.
-    # 2. Generate a secure token.
-    # 3. Send them a WhatsApp message with a special deep link that opens the app.
-    
-    return jsonify({'status': 'success', 'message': 'If your number is registered, you will receive a login link via WhatsApp.'})
+@api.route('/verify_otp', methods=['POST'])
+def api_verify_otp():
+    """Exchanges a valid login code for the account's API key (created on first login)."""
+    phone, model, error = _login_request()
+    if error:
+        return error
+    limited = _check_limits((OTP_VERIFY_IP_LIMIT, client_ip()), (OTP_VERIFY_PHONE_LIMIT, phone))
+    if limited:
+        return limited
+
+    otp = str((request.get_json(silent=True) or {}).get('otp', '')).strip()
+    account = model.query.filter_by(phone_number=phone).first()
+    if not account or not account.verify_otp(otp):
+        if account:
+            record_failed_otp(account)
+            db.session.commit()
+        return jsonify({'error': 'Invalid or expired code'}), 401
+    # Codes are single use.
+    account.otp_hash, account.otp_expiry, account.otp_attempts = None, None, 0
+    if not account.api_key:
+        account.generate_api_key()
+    db.session.commit()
+    OTP_VERIFY_PHONE_LIMIT.reset(phone)
+    return jsonify({'api_key': account.api_key, 'user_type': 'fixer' if model is Fixer else 'client', 'id': account.id})
 
 
 # --- API DATA ROUTES ---
 
+JOBS_PAGE_SIZE = 50
+JOBS_MAX_PAGE_SIZE = 200
+JOB_DEFAULT_FIELDS = ['id', 'description', 'status', 'area', 'created_at', 'amount', 'payment_status', 'rating']
+
 @api.route('/jobs', methods=['GET'])
+@api_key_required
 def api_get_jobs():
     """
-    API endpoint for the mobile app to get a list of jobs.
-    This will be a protected route.
+    The caller's jobs (including archived ones), newest first, keyset
+    paginated on (created_at, id). Query parameters: `fields` (comma
+    separated; only those columns are selected), `status`, `limit`, and
+    `cursor` (the `next_cursor` of the previous page).
     """
-    # Placeholder for logic to get jobs for the logged-in user or fixer
-    print("API: Received request to get jobs.")
-    
-    # Example of what the JSON response will look like
-    mock_jobs = [
-        {'id': 1, 'description': 'Leaking pipe under kitchen sink', 'status': 'complete'},
-        {'id': 2, 'description': 'Install new ceiling fan', 'status': 'accepted'}
-    ]
-    
-    return jsonify(mock_jobs)
+    fields = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()] or JOB_DEFAULT_FIELDS
+    unknown = [name for name in fields if name not in JOB_HISTORY_COLUMNS]
+    if unknown:
+        return json_response({'error': f"Unknown field(s): {', '.join(unknown)}", 'fields': JOB_HISTORY_COLUMNS}, 400)
+    limit = min(max(request.args.get('limit', JOBS_PAGE_SIZE, type=int), 1), JOBS_MAX_PAGE_SIZE)
+
+    columns = JobHistory.__table__.c
+    # The cursor columns are always selected, whether or not they were asked for.
+    selected = list(dict.fromkeys(fields + ['created_at', 'id']))
+    owner = columns.client_id if g.api_user_type == 'client' else columns.fixer_id
+    # Rows without created_at (only possible for very old jobs) have no place in the (created_at, id) order.
+    query = (db.select(*[columns[name] for name in selected])
+             .where(owner == g.api_user_id, columns.created_at.isnot(None)))
+    if request.args.get('status'):
+        query = query.where(columns.status == request.args['status'])
+    if request.args.get('cursor'):
+        cursor = _decode_cursor(request.args['cursor'])
+        if cursor is None:
+            return json_response({'error': 'Invalid cursor'}, 400)
+        query = query.where(db.tuple_(columns.created_at, columns.id) < cursor)
+    rows = db.session.execute(
+        query.order_by(columns.created_at.desc(), columns.id.desc()).limit(limit + 1)
+    ).all()
+
+    next_cursor = _encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    jobs = [{name: getattr(row, name) for name in fields} for row in rows[:limit]]
+    return json_response({'jobs': jobs, 'next_cursor': next_cursor})
+
+# --- NEW: Delta sync ---
+# Rows are returned in (sync_version, id) order, and only up to the settled
+# version (see models.settled_sync_version), so a transaction that is still
+# open when we read shows up in a later sync instead of being skipped.
+# Jobs that left the caller's view in the same range of versions (reassigned,
+# unassigned, archived or deleted) are listed by ID in `removed`.
+SYNC_PAGE_SIZE = 200
+JOB_SYNC_FIELDS = ['id', 'description', 'status', 'area', 'created_at', 'updated_at', 'fixer_id',
+                   'amount', 'payment_status', 'fixer_fee_status', 'rating', 'sync_version']
+FIXER_SYNC_FIELDS = ['id', 'full_name', 'is_active', 'vetting_status', 'balance', 'updated_at', 'sync_version']
+
+def _encode_sync_cursor(version, job_id):
+    raw = f"{version}|{job_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_sync_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        version, job_id = raw.split('|')
+        return int(version), int(job_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+@api.route('/sync', methods=['GET'])
+@api_key_required
+def api_sync():
+    """
+    Jobs changed since `since` (the `next_cursor` of the previous sync; omit
+    it for a full sync), oldest change first. A fixer also gets their own
+    profile when it changed, and `removed` lists jobs to drop from the local
+    copy. Keep calling with `next_cursor` while `has_more`. A cursor this endpoint no longer understands gets a 400; sync again without `since`.
+    """
+    since = None
+    if request.args.get('since'):
+        since = _decode_sync_cursor(request.args['since'])
+        if since is None:
+            return json_response({'error': 'Invalid cursor'}, 400)
+    limit = min(max(request.args.get('limit', SYNC_PAGE_SIZE, type=int), 1), SYNC_PAGE_SIZE)
+    settled = db.session.scalar(db.select(settled_sync_version()))
+
+    owner = Job.client_id if g.api_user_type == 'client' else Job.fixer_id
+    query = (db.select(*[getattr(Job, name) for name in JOB_SYNC_FIELDS])
+             .where(owner == g.api_user_id, Job.sync_version < settled))
+    if since:
+        query = query.where(db.tuple_(Job.sync_version, Job.id) > since)
+    rows = db.session.execute(query.order_by(Job.sync_version, Job.id).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
 
+    payload = {'jobs': [row._asdict() for row in rows], 'has_more': has_more, 'removed': []}
+    if has_more:
+        payload['next_cursor'] = _encode_sync_cursor(rows[-1].sync_version, rows[-1].id)
+    else:
+        # Everything that settled has been returned, so the next sync can start from there.
+        payload['next_cursor'] = _encode_sync_cursor(settled, 0)
+    if since:
+        # Up to, not including, the version the next page starts at. A job that
+        # is the caller's again is not removed; its new version comes as a row.
+        upto = rows[-1].sync_version if has_more else settled
+        payload['removed'] = db.session.scalars(
+            db.select(SyncRemoval.job_id).distinct()
+            .where(SyncRemoval.owner_type == g.api_user_type, SyncRemoval.owner_id == g.api_user_id,
+                   SyncRemoval.sync_version >= since[0], SyncRemoval.sync_version < upto,
+                   ~db.select(Job.id).where(Job.id == SyncRemoval.job_id, owner == g.api_user_id).exists())
+            .order_by(SyncRemoval.job_id)
+        ).all()
+    if g.api_user_type == 'fixer':
+        profile = db.session.execute(
+            db.select(*[getattr(Fixer, name) for name in FIXER_SYNC_FIELDS])
+            .where(Fixer.id == g.api_user_id, Fixer.sync_version < settled)
+        ).first()
+        if profile and (since is None or profile.sync_version >= since[0]):
+            payload['profile'] = profile._asdict()
+    return json_response(payload)
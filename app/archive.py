@@ -0,0 +1,61 @@
+# app/archive.py
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, insert, literal, select
+
+from .models import db, Job, ArchivedJob, JOB_HISTORY_COLUMNS, record_sync_removals
+
+# Finished jobs nobody works on any more are moved from `jobs` to
+# `jobs_archive` so the hot table (and its indexes) stays small. History
+# pages read both through models.JobHistory / the `jobs_all` view.
+
+ARCHIVABLE_STATUSES = ('complete', 'cancelled')
+
+
+def _archivable(cutoff):
+    return (Job.status.in_(ARCHIVABLE_STATUSES), Job.created_at < cutoff)
+
+
+def archive_cutoff(older_than_days):
+    return datetime.now(timezone.utc) - timedelta(days=older_than_days)
+
+
+def count_archivable(older_than_days):
+    return db.session.scalar(select(func.count(Job.id)).where(*_archivable(archive_cutoff(older_than_days))))
+
+
+def archive_jobs(older_than_days, batch_size=1000, progress=None):
+    """
+    Moves finished jobs created more than `older_than_days` ago into
+    `jobs_archive`, one INSERT ... SELECT and DELETE per batch, each batch in
+    its own transaction. Returns the number of jobs moved.
+    """
+    cutoff = archive_cutoff(older_than_days)
+    job_columns = [Job.__table__.c[name] for name in JOB_HISTORY_COLUMNS]
+    archive_columns = [ArchivedJob.__table__.c[name] for name in JOB_HISTORY_COLUMNS]
+    total = 0
+    while True:
+        ids = db.session.scalars(
+            select(Job.id).where(*_archivable(cutoff)).order_by(Job.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        archived_at = datetime.now(timezone.utc)
+        # Archived jobs drop out of /api/sync, so clients and fixers are told to remove them.
+        record_sync_removals(Job.id.in_(ids))
+        db.session.execute(
+            insert(ArchivedJob.__table__).from_select(
+                archive_columns + [ArchivedJob.__table__.c.archived_at],
+                select(*job_columns, literal(archived_at, ArchivedJob.__table__.c.archived_at.type))
+                .where(Job.id.in_(ids)),
+            )
+        )
+        moved = db.session.execute(
+            delete(Job).where(Job.id.in_(ids)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        total += moved
+        if progress is not None:
+            progress(total)
+    db.session.expire_all()
+    return total
@@ -0,0 +1,63 @@
+# app/background.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import metrics
+
+# Small in-process executor for work that should not hold up a response
+# (e.g. matching a fixer after a payment notification). The pool is created
+# on first use, so a gunicorn master that preloads the app never starts
+# threads that its forked workers would inherit half-initialised.
+#
+# Work is not durable: callers record what needs doing in the database first,
+# so anything lost with a worker can be picked up again by a CLI command.
+
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', '4'))
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+_pending = 0
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix='fixmate-background')
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _pending_tasks():
+    return _pending
+
+
+metrics.register_gauge('background.pending', _pending_tasks)
+
+
+def submit(app, func, *args, **kwargs):
+    """Runs func(*args, **kwargs) on the background pool inside an app context for `app`."""
+    global _pending
+    name = getattr(func, '__name__', 'task')
+
+    def run():
+        global _pending
+        start = time.perf_counter()
+        try:
+            with app.app_context():
+                return func(*args, **kwargs)
+        except Exception as e:
+            metrics.inc(f"background.{name}.failures")
+            print(f"ERROR: Background task {name} failed: {e}")
+        finally:
+            metrics.observe(f"background.{name}", time.perf_counter() - start)
+            with _lock:
+                _pending -= 1
+
+    with _lock:
+        _pending += 1
+    return _get_executor().submit(run)
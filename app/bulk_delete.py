@@ -0,0 +1,102 @@
+# app/bulk_delete.py
+from sqlalchemy import delete, exists, func, select, update
+
+from .models import db, User, Fixer, Job, ArchivedJob, JobHistory, LedgerEntry, record_sync_removals
+
+# Clients and fixers are removed with chunked, set-based DELETE statements
+# instead of loading every row (and its jobs) into the ORM session. The
+# foreign keys do the rest: deleting a user cascades to their jobs, live and
+# archived (ondelete='CASCADE'), and deleting a fixer unassigns their archived
+# jobs (ondelete='SET NULL'). Live jobs are unassigned explicitly, and removals
+# recorded, so /api/sync clients hear about both.
+#
+# Fixers with entries in the balance ledger are never deleted: the ledger is
+# the financial record and its foreign key is ON DELETE RESTRICT. Deactivate
+# them instead (`flask toggle-fixer-active`).
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _foreign_key_actions_enforced():
+    # SQLite ignores ON DELETE unless PRAGMA foreign_keys is on for the connection.
+    if db.engine.dialect.name != 'sqlite':
+        return True
+    return bool(db.session.execute(db.text("PRAGMA foreign_keys")).scalar())
+
+
+def count_clients(*criteria):
+    """Returns (clients, jobs) that delete_clients would remove."""
+    ids = select(User.id).where(*criteria)
+    clients = db.session.scalar(select(func.count()).select_from(ids.subquery()))
+    jobs = db.session.scalar(select(func.count(JobHistory.id)).where(JobHistory.client_id.in_(ids)))
+    return clients, jobs
+
+
+def _without_ledger_history():
+    return ~exists().where(LedgerEntry.fixer_id == Fixer.id)
+
+
+def count_fixers(*criteria):
+    """Returns (fixers, jobs) that delete_fixers would remove and unassign."""
+    ids = select(Fixer.id).where(*criteria, _without_ledger_history())
+    fixers = db.session.scalar(select(func.count()).select_from(ids.subquery()))
+    jobs = db.session.scalar(select(func.count(JobHistory.id)).where(JobHistory.fixer_id.in_(ids)))
+    return fixers, jobs
+
+
+def count_fixers_with_ledger_history(*criteria):
+    """How many fixers matching `criteria` delete_fixers would keep because of their ledger entries."""
+    return db.session.scalar(select(func.count(Fixer.id)).where(*criteria, ~_without_ledger_history()))
+
+
+def _delete_in_chunks(model, criteria, chunk_size, before_delete=None, progress=None):
+    total = 0
+    while True:
+        chunk = select(model.id).where(*criteria).order_by(model.id).limit(chunk_size)
+        ids = db.session.scalars(chunk).all()
+        if not ids:
+            break
+        if before_delete is not None:
+            before_delete(ids)
+        deleted = db.session.execute(
+            delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        total += deleted
+        if progress is not None:
+            progress(total)
+    # Anything the session still holds may refer to rows that no longer exist.
+    db.session.expire_all()
+    return total
+
+
+def delete_clients(*criteria, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Deletes every user matching `criteria`, with their jobs, one chunk per transaction."""
+    enforced = _foreign_key_actions_enforced()
+
+    def before_delete(ids):
+        # The jobs' fixers learn through /api/sync that they are gone.
+        record_sync_removals(Job.client_id.in_(ids), owners=('fixer',))
+        if not enforced:
+            for model in (Job, ArchivedJob):
+                db.session.execute(delete(model).where(model.client_id.in_(ids))
+                                   .execution_options(synchronize_session=False))
+    return _delete_in_chunks(User, criteria, chunk_size, before_delete, progress)
+
+
+def delete_fixers(*criteria, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Deletes every fixer matching `criteria` that has no ledger entries,
+    leaving their jobs unassigned, one chunk per transaction.
+    """
+    enforced = _foreign_key_actions_enforced()
+
+    def before_delete(ids):
+        # Unassigned here rather than by ON DELETE SET NULL, so the jobs get a new
+        # sync_version and their clients see the change through /api/sync.
+        db.session.execute(update(Job).where(Job.fixer_id.in_(ids)).values(fixer_id=None)
+                           .execution_options(synchronize_session=False))
+        if not enforced:
+            db.session.execute(update(ArchivedJob).where(ArchivedJob.fixer_id.in_(ids)).values(fixer_id=None)
+                               .execution_options(synchronize_session=False))
+    return _delete_in_chunks(Fixer, criteria + (_without_ledger_history(),), chunk_size, before_delete, progress)
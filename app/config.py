@@ -5,11 +5,28 @@ from dotenv import load_dotenv
 basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '..', '.env'))
 
+def _database_url(name):
+    # Heroku-style postgres:// URLs are not accepted by SQLAlchemy 1.4+.
+    url = os.environ.get(name)
+    if url and url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
 class Config:
     # --- UPDATED: Removed old Twilio credentials ---
     
     # --- NEW: Add 360dialog API Key ---
     DIALOG_360_API_KEY = os.environ.get('DIALOG_360_API_KEY')
 
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'a-very-secret-key-that-is-long-and-random')
+
     # Database
-    DATABASE_URL = os.environ.get('DATABASE_URL')
+    DATABASE_URL = _database_url('DATABASE_URL')
+    SQLALCHEMY_DATABASE_URI = DATABASE_URL
+    # Optional read replica for @read_only views and commands (see app/db_routing.py)
+    DATABASE_REPLICA_URL = _database_url('DATABASE_REPLICA_URL')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Behind a load balancer, the number of proxies whose X-Forwarded-For/-Proto headers are trusted.
+    # Heroku (DYNO is set) always has its router in front; without this every client
+    # would share the router's IP and the per-IP rate limits would be one global bucket.
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES') or (1 if os.environ.get('DYNO') else 0))
@@ -0,0 +1,66 @@
+# app/conversation.py
+import json
+from datetime import datetime, timedelta, timezone
+
+from .models import db
+
+
+class ConversationSession:
+    """
+    Unit of work for one inbound message. The user's conversation state and
+    `service_request_cache` JSON are decoded once, mutated in memory while the
+    message is handled, and written back with a single commit at the end.
+
+    If `ttl_seconds` is given, a conversation idle for longer than that is
+    treated as abandoned and starts over instead of resuming mid-flow.
+    """
+
+    def __init__(self, user, ttl_seconds=None):
+        self.user = user
+        self.state = user.conversation_state
+        self.data = json.loads(user.service_request_cache) if user.service_request_cache else {}
+        self._dirty = False
+        if self.state is not None and ttl_seconds and self._idle_for(user) > timedelta(seconds=ttl_seconds):
+            print(f"Conversation for {user.phone_number} expired in state {self.state}. Starting over.")
+            self.clear()
+
+    @staticmethod
+    def _idle_for(user):
+        updated_at = user.conversation_updated_at
+        if updated_at is None:
+            return timedelta(0)
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) - updated_at
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set_state(self, new_state, data=None):
+        """Moves the user to `new_state`, merging `data` into the cached request details."""
+        self.state = new_state
+        if data:
+            self.data.update(data)
+        self._dirty = True
+
+    def clear(self):
+        """Resets the user's conversation state and cached request details."""
+        self.state = None
+        self.data = {}
+        self._dirty = True
+
+    def flush_state(self):
+        """Copies the in-memory state onto the user row without committing."""
+        if self._dirty:
+            self.user.conversation_state = self.state
+            self.user.service_request_cache = json.dumps(self.data) if self.state is not None else None
+            self._dirty = False
+        # Any handled message counts as activity, even if it didn't move the conversation on.
+        self.user.conversation_updated_at = datetime.now(timezone.utc) if self.state is not None else None
+        self.user.conversation_nudged_at = None
+
+    def commit(self):
+        """Writes the state and every other change made while handling the message in one commit."""
+        self.flush_state()
+        db.session.commit()
+        print(f"State for {self.user.phone_number} is now {self.state} with data: {self.data}")
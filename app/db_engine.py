@@ -0,0 +1,97 @@
+# app/db_engine.py
+import os
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from . import metrics
+
+# Engine and pool settings, read from the environment so they can be tuned per
+# deployment without code changes:
+#   DB_POOL_PRE_PING   test connections on checkout (default on), so a Postgres
+#                      restart or an idle timeout on the host doesn't fail the next request
+#   DB_POOL_RECYCLE    seconds before a connection is replaced (default 300)
+#   DB_POOL_SIZE       connections kept per worker process; defaults to the
+#                      gunicorn thread count (GUNICORN_THREADS) plus one for
+#                      background work
+#   DB_MAX_OVERFLOW    extra connections allowed under bursts (default: DB_POOL_SIZE)
+#   DB_POOL_TIMEOUT    seconds to wait for a free connection (default 10)
+#   DB_MAX_CONNECTIONS optional server limit; a warning is printed if
+#                      WEB_CONCURRENCY workers could exceed it
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_flag(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.inc('db.pool.timeouts')
+            raise
+        finally:
+            metrics.observe('db.pool.checkout_wait', time.perf_counter() - start)
+
+
+def engine_options(database_url):
+    """Returns SQLALCHEMY_ENGINE_OPTIONS for `database_url`."""
+    options = {
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', True),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 300),
+    }
+    if not database_url or database_url.startswith('sqlite'):
+        return options
+
+    threads = _env_int('GUNICORN_THREADS', 1)
+    pool_size = _env_int('DB_POOL_SIZE', threads + 1)
+    max_overflow = _env_int('DB_MAX_OVERFLOW', pool_size)
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 10),
+    })
+
+    max_connections = _env_int('DB_MAX_CONNECTIONS', 0)
+    workers = _env_int('WEB_CONCURRENCY', 1)
+    if max_connections and workers * (pool_size + max_overflow) > max_connections:
+        print(f"WARN: {workers} worker(s) x (pool {pool_size} + overflow {max_overflow}) can open more than "
+              f"DB_MAX_CONNECTIONS={max_connections} connections. Lower DB_POOL_SIZE or DB_MAX_OVERFLOW.")
+    return options
+
+
+def register_pool_metrics(engines):
+    """Exposes pool usage for each engine (e.g. db.engines) as gauges."""
+    for bind_key, engine in engines.items():
+        if not isinstance(engine.pool, QueuePool):
+            continue
+        prefix = f"db.pool.{bind_key or 'default'}"
+        # Read engine.pool on every call: dispose() replaces the pool object.
+        metrics.register_gauge(f"{prefix}.size", lambda engine=engine: engine.pool.size())
+        metrics.register_gauge(f"{prefix}.checked_out", lambda engine=engine: engine.pool.checkedout())
+        # QueuePool counts unopened pool slots as negative overflow.
+        metrics.register_gauge(f"{prefix}.overflow", lambda engine=engine: max(engine.pool.overflow(), 0))
+
+
+def dispose_engines_after_fork(engines):
+    """
+    Drops connections inherited from the parent process (gunicorn --preload)
+    without closing them, so the parent's sockets are left alone and each
+    worker opens its own.
+    """
+    for engine in engines.values():
+        engine.dispose(close=False)
@@ -0,0 +1,137 @@
+# app/db_routing.py
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+from . import metrics
+
+# Optional read replica. When DATABASE_REPLICA_URL is set, run.py registers it
+# as the 'replica' bind. Views and CLI commands decorated with @read_only send
+# their SELECTs there; everything else (and every write, flush or raw SQL
+# statement, even inside a read_only block) stays on the primary.
+#
+# The replica is skipped while it lags more than DATABASE_REPLICA_MAX_LAG_SECONDS
+# behind, and for that long after a request from the same browser session
+# committed a write, so users always see their own changes.
+
+REPLICA_BIND = 'replica'
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DATABASE_REPLICA_MAX_LAG_SECONDS', '10'))
+REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('DATABASE_REPLICA_LAG_CHECK_SECONDS', '5'))
+
+_read_only = ContextVar('read_only', default=False)
+
+_RECENT_WRITE_KEY = '_db_primary_until'
+
+
+class _LagCheck:
+    """Caches the replica's replication lag so it is measured at most once every few seconds per process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._healthy = False
+
+    def replica_is_fresh(self, engine):
+        now = time.monotonic()
+        if now - self._checked_at < REPLICA_LAG_CHECK_SECONDS:
+            return self._healthy
+        with self._lock:
+            if now - self._checked_at >= REPLICA_LAG_CHECK_SECONDS:
+                self._healthy = self._measure(engine)
+                self._checked_at = now
+        return self._healthy
+
+    @staticmethod
+    def _measure(engine):
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name != 'postgresql':
+                    lag = 0.0
+                else:
+                    # An idle primary leaves the replay timestamp old even though nothing is pending.
+                    lag = conn.execute(text(
+                        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                    )).scalar()
+            metrics.observe('db.replica.lag', float(lag or 0.0))
+            if lag and lag > REPLICA_MAX_LAG_SECONDS:
+                print(f"WARN: Read replica is {lag:.1f}s behind. Reading from the primary until it catches up.")
+                return False
+            return True
+        except Exception as e:
+            print(f"WARN: Read replica unavailable, reading from the primary: {e}")
+            return False
+
+
+_lag_check = _LagCheck()
+
+
+def _recently_wrote():
+    if not has_request_context():
+        return False
+    return flask_session.get(_RECENT_WRITE_KEY, 0) > time.time()
+
+
+def mark_recent_write():
+    """Keeps this browser session's @read_only views on the primary until the replica has caught up."""
+    flask_session[_RECENT_WRITE_KEY] = time.time() + REPLICA_MAX_LAG_SECONDS
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends SELECTs issued inside a read_only block to the replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _read_only.get() and not self._flushing and getattr(clause, 'is_select', False):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                if _lag_check.replica_is_fresh(replica) and not _recently_wrote():
+                    return replica
+                metrics.inc('db.replica.fallbacks')
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _executed(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _committed(session):
+    if session.info.pop('wrote', False) and has_request_context() and REPLICA_BIND in session._db.engines:
+        mark_recent_write()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _rolled_back(session):
+    session.info.pop('wrote', None)
+
+
+@contextmanager
+def replica_reads():
+    token = _read_only.set(True)
+    try:
+        yield
+    finally:
+        _read_only.reset(token)
+
+
+def read_only(func):
+    """Marks a view or CLI command whose queries may be served by the read replica."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return func(*args, **kwargs)
+    return wrapper
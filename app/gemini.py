@@ -0,0 +1,25 @@
+# app/gemini.py
+import os
+import threading
+
+# google.generativeai pulls in grpc and protobuf, which take around a second
+# to import, and grpc does not survive a fork. It is therefore imported on first
+# use: a gunicorn master preloading the app never loads it, and a worker only
+# pays for it when a Gemini feature is actually used.
+
+_genai = None
+_lock = threading.Lock()
+
+
+def gemini():
+    """The google.generativeai module, imported and configured with GEMINI_API_KEY on first call."""
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as genai
+                api_key = os.environ.get('GEMINI_API_KEY')
+                if api_key:
+                    genai.configure(api_key=api_key)
+                _genai = genai
+    return _genai
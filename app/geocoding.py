@@ -0,0 +1,278 @@
+# app/geocoding.py
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+# --- Offline Area Index ---
+# The index file is a flat, memory-mappable layout so every gunicorn worker can
+# share the same pages instead of holding its own copy of the suburb dataset:
+#
+#   header  : magic, entry count, name blob size, min cos(lat) of the dataset
+#   float64 : latitude[count], longitude[count], radius_km[count]
+#   uint32  : name_offset[count + 1]
+#   bytes   : utf-8 name blob
+#
+# Entries are stored as an implicit KD-tree: the median of every sub-range sits
+# at its middle index, alternating latitude/longitude splits per level.
+
+INDEX_MAGIC = b'FMAREA01'
+_HEADER = struct.Struct('<8sIId')
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org/reverse'
+NOMINATIM_HEADERS = {'User-Agent': 'FixMate-SA/1.0'}
+UNKNOWN_AREA = "Unknown Area"
+
+_area_index = None
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _ring_centroid_and_radius(ring):
+    """Returns the vertex centroid of a polygon ring and the distance to its furthest vertex."""
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring = ring[:-1]
+    lat = sum(point[1] for point in ring) / len(ring)
+    lon = sum(point[0] for point in ring) / len(ring)
+    radius = max(_haversine_km(lat, lon, point[1], point[0]) for point in ring)
+    return lat, lon, radius
+
+
+def _feature_to_entry(feature, name_property, point_radius_km):
+    properties = feature.get('properties') or {}
+    name = properties.get(name_property) or properties.get('name')
+    geometry = feature.get('geometry') or {}
+    if not name or not geometry:
+        return None
+
+    geom_type = geometry.get('type')
+    coords = geometry.get('coordinates')
+    if geom_type == 'Point':
+        return coords[1], coords[0], point_radius_km, name
+    if geom_type == 'Polygon':
+        lat, lon, radius = _ring_centroid_and_radius(coords[0])
+        return lat, lon, radius, name
+    if geom_type == 'MultiPolygon':
+        # Use the outer ring of the largest part; suburbs with detached islands are rare.
+        ring = max((polygon[0] for polygon in coords), key=len)
+        lat, lon, radius = _ring_centroid_and_radius(ring)
+        return lat, lon, radius, name
+    return None
+
+
+def _build_implicit_kdtree(entries, lo, hi, depth):
+    if hi - lo <= 1:
+        return
+    axis = depth % 2
+    entries[lo:hi] = sorted(entries[lo:hi], key=lambda entry: entry[axis])
+    mid = (lo + hi) // 2
+    _build_implicit_kdtree(entries, lo, mid, depth + 1)
+    _build_implicit_kdtree(entries, mid + 1, hi, depth + 1)
+
+
+def build_area_index(geojson_path, output_path, name_property='name', point_radius_km=3.0):
+    """
+    Builds a memory-mappable area index from a GeoJSON FeatureCollection of
+    suburb points or polygons (e.g. an OSM place=suburb extract).
+    Returns the number of areas written.
+    """
+    with open(geojson_path, 'r', encoding='utf-8') as f:
+        collection = json.load(f)
+
+    entries = []
+    for feature in collection.get('features', []):
+        entry = _feature_to_entry(feature, name_property, point_radius_km)
+        if entry:
+            entries.append(entry)
+    if not entries:
+        raise ValueError(f"No usable features with a '{name_property}' property in {geojson_path}.")
+
+    _build_implicit_kdtree(entries, 0, len(entries), 0)
+
+    max_abs_lat = max(abs(entry[0]) + entry[2] / KM_PER_DEGREE_LAT for entry in entries)
+    min_cos_lat = math.cos(math.radians(min(89.0, max_abs_lat)))
+
+    names = [entry[3].encode('utf-8') for entry in entries]
+    offsets, position = [], 0
+    for encoded in names:
+        offsets.append(position)
+        position += len(encoded)
+    offsets.append(position)
+
+    count = len(entries)
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(INDEX_MAGIC, count, position, min_cos_lat))
+        f.write(struct.pack(f'<{count}d', *(entry[0] for entry in entries)))
+        f.write(struct.pack(f'<{count}d', *(entry[1] for entry in entries)))
+        f.write(struct.pack(f'<{count}d', *(entry[2] for entry in entries)))
+        f.write(struct.pack(f'<{count + 1}I', *offsets))
+        f.write(b''.join(names))
+    os.replace(tmp_path, output_path)
+    return count
+
+
+class AreaIndex:
+    """Read-only, memory-mapped nearest-area lookup over an index built by `build_area_index`."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, names_size, min_cos_lat = _HEADER.unpack_from(self._mmap, 0)
+        if magic != INDEX_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a FixMate area index.")
+
+        self.count = count
+        self._km_per_degree_lon = KM_PER_DEGREE_LAT * min_cos_lat
+        view = memoryview(self._mmap)
+        offset = _HEADER.size
+        block = count * 8
+        self._lat = view[offset:offset + block].cast('d'); offset += block
+        self._lon = view[offset:offset + block].cast('d'); offset += block
+        self._radius = view[offset:offset + block].cast('d'); offset += block
+        self._name_offsets = view[offset:offset + (count + 1) * 4].cast('I'); offset += (count + 1) * 4
+        self._names = view[offset:offset + names_size]
+
+    def _name(self, i):
+        return bytes(self._names[self._name_offsets[i]:self._name_offsets[i + 1]]).decode('utf-8')
+
+    def nearest(self, lat, lon):
+        """Returns (entry_index, distance_km) of the closest area centroid."""
+        best = [-1, float('inf')]
+        lats, lons = self._lat, self._lon
+        km_per_degree_lon = self._km_per_degree_lon
+
+        def search(lo, hi, depth):
+            if lo >= hi:
+                return
+            mid = (lo + hi) // 2
+            distance = _haversine_km(lat, lon, lats[mid], lons[mid])
+            if distance < best[1]:
+                best[0], best[1] = mid, distance
+            if depth % 2 == 0:
+                delta = lat - lats[mid]
+                bound = abs(delta) * KM_PER_DEGREE_LAT
+            else:
+                delta = lon - lons[mid]
+                bound = abs(delta) * km_per_degree_lon
+            near, far = ((lo, mid), (mid + 1, hi)) if delta < 0 else ((mid + 1, hi), (lo, mid))
+            search(near[0], near[1], depth + 1)
+            if bound < best[1]:
+                search(far[0], far[1], depth + 1)
+
+        search(0, self.count, 0)
+        return best[0], best[1]
+
+    def lookup(self, lat, lon):
+        """Returns the area covering the point, or None if it falls outside the dataset's coverage."""
+        if not self.count:
+            return None
+        i, distance = self.nearest(float(lat), float(lon))
+        if i < 0 or distance > self._radius[i]:
+            return None
+        return self._name(i)
+
+    def close(self):
+        for view in (self._lat, self._lon, self._radius, self._name_offsets, self._names):
+            view.release()
+        self._mmap.close()
+
+
+def load_area_index(path):
+    """Loads the offline area index used by `resolve_area`. Returns None if the file is missing."""
+    global _area_index
+    if not path or not os.path.exists(path):
+        print(f"WARN: Area index not found at '{path}'. Falling back to Nominatim only.")
+        return None
+    _area_index = AreaIndex(path)
+    print(f"Loaded offline area index with {_area_index.count} areas from {path}")
+    return _area_index
+
+
+def get_area_index():
+    return _area_index
+
+
+# --- Remote Fallback ---
+class RequestThrottle:
+    """Spaces out calls across threads so they never exceed `rate` requests per second."""
+
+    def __init__(self, rate):
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Nominatim's usage policy allows at most one request per second per application.
+nominatim_throttle = RequestThrottle(float(os.environ.get('NOMINATIM_MAX_RPS', '1')))
+
+
+def reverse_geocode_nominatim(lat, lon, error_value=UNKNOWN_AREA):
+    """
+    Performs a reverse geocoding lookup to get a suburb/city from coordinates.
+    Uses the free OpenStreetMap Nominatim API, throttled to its rate limit.
+    Returns `error_value` if the API call fails.
+    """
+    import requests  # deferred so importing the app stays fast
+
+    try:
+        nominatim_throttle.wait()
+        params = {'format': 'json', 'lat': lat, 'lon': lon}
+        response = requests.get(NOMINATIM_URL, params=params, headers=NOMINATIM_HEADERS, timeout=10)
+        response.raise_for_status()
+
+        address = response.json().get('address', {})
+
+        # Try to get the most specific location available
+        area = address.get('suburb') or address.get('city_district') or address.get('city') or address.get('town')
+
+        if area:
+            print(f"Reverse geocoding successful: Found area '{area}'")
+            return area
+        else:
+            print("Reverse geocoding could not determine a specific area.")
+            return UNKNOWN_AREA
+
+    except requests.exceptions.RequestException as e:
+        print(f"Error during reverse geocoding API call: {e}")
+        return error_value # Fallback in case of API error
+
+
+def resolve_area(lat, lon, allow_remote=True, error_value=UNKNOWN_AREA):
+    """
+    Resolves coordinates to an area name, answering from the offline index when
+    the point is covered and only calling Nominatim for points outside it.
+    Returns None when the point is uncovered and `allow_remote` is False.
+    """
+    if lat is None or lon is None:
+        return None
+    if _area_index is not None:
+        area = _area_index.lookup(lat, lon)
+        if area:
+            return area
+    if not allow_remote:
+        return None
+    return reverse_geocode_nominatim(lat, lon, error_value=error_value)
@@ -0,0 +1,42 @@
+# app/json_provider.py
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: Flask's json-based provider is used without it
+    orjson = None
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson, for jsonify and request.get_json.
+    Output matches the default provider: keys are sorted, and datetimes,
+    Decimals and UUIDs go through the same `default` (e.g. datetimes as HTTP dates).
+    """
+
+    def _options(self, indent=False):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options(bool(kwargs.get('indent')))).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = not (self.compact or (self.compact is None and not self._app.debug))
+        # Newline-terminated, like Flask's own jsonify.
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self._options(indent)) + b"\n", mimetype=self.mimetype)
+
+
+def init_app(app):
+    """Switches `app` to ORJSONProvider when orjson is installed."""
+    if orjson is not None:
+        app.json = ORJSONProvider(app)
@@ -0,0 +1,118 @@
+# app/ledger.py
+from decimal import Decimal
+
+from sqlalchemy import and_, func, insert, select, text, update
+
+from .models import db, Fixer, Job, LedgerEntry, BalanceSnapshot
+
+# Every change to Fixer.balance goes through record_entry, which appends a
+# balance_ledger row and adjusts the balance with a single
+# UPDATE ... SET balance = balance + :amount in the caller's transaction.
+# Concurrent requests therefore cannot lose each other's changes, and the
+# ledger explains every cent of the balance.
+#
+# Snapshots (`flask ledger-snapshot`) store each fixer's ledger balance up to
+# an entry ID, so reconciliation reads one snapshot plus the entries after it.
+# That ID must not pass an entry another transaction has inserted but not yet
+# committed: it would sit below the snapshot yet be missing from it, and never
+# be counted. take_snapshots therefore only reads once no such entry exists.
+
+ENTRY_TYPES = ('opening', 'fee', 'topup', 'payout')
+
+
+def record_entry(fixer_id, entry_type, amount, job_id=None, note=None):
+    """Appends a ledger entry and applies `amount` to the fixer's balance. Does not commit."""
+    if entry_type not in ENTRY_TYPES:
+        raise ValueError(f"Unknown ledger entry type '{entry_type}'.")
+    amount = Decimal(amount)
+    entry = LedgerEntry(fixer_id=fixer_id, entry_type=entry_type, amount=amount, job_id=job_id, note=note)
+    db.session.add(entry)
+    db.session.execute(
+        update(Fixer).where(Fixer.id == fixer_id).values(balance=Fixer.balance + amount)
+    )
+    return entry
+
+
+def complete_job_and_charge_fee(job, fee):
+    """
+    Marks an accepted job complete and deducts `fee` from its fixer, both in
+    the current transaction. The status change is conditional, so a job
+    completed twice at the same time is only charged once. Returns False if
+    the job was no longer 'accepted'.
+    """
+    completed = db.session.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == 'accepted')
+        .values(status='complete', fixer_fee_status='paid')
+    ).rowcount
+    if not completed:
+        return False
+    record_entry(job.fixer_id, 'fee', -Decimal(fee), job_id=job.id, note=f"Platform fee for job #{job.id}")
+    return True
+
+
+def _latest_snapshots():
+    latest = (select(BalanceSnapshot.fixer_id, func.max(BalanceSnapshot.ledger_entry_id).label('upto'))
+              .group_by(BalanceSnapshot.fixer_id)
+              .subquery())
+    return (select(BalanceSnapshot.fixer_id, BalanceSnapshot.ledger_entry_id, BalanceSnapshot.balance)
+            .join(latest, and_(BalanceSnapshot.fixer_id == latest.c.fixer_id,
+                               BalanceSnapshot.ledger_entry_id == latest.c.upto))
+            .subquery())
+
+
+def ledger_balances(fixer_ids=None):
+    """
+    Returns {fixer_id: balance} computed from each fixer's latest snapshot
+    plus the ledger entries after it, in one query.
+    """
+    snapshot = _latest_snapshots()
+    recent = (select(LedgerEntry.fixer_id, func.sum(LedgerEntry.amount).label('delta'))
+              .outerjoin(snapshot, snapshot.c.fixer_id == LedgerEntry.fixer_id)
+              .where(LedgerEntry.id > func.coalesce(snapshot.c.ledger_entry_id, 0))
+              .group_by(LedgerEntry.fixer_id)
+              .subquery())
+    query = (select(Fixer.id,
+                    func.coalesce(snapshot.c.balance, 0) + func.coalesce(recent.c.delta, 0))
+             .outerjoin(snapshot, snapshot.c.fixer_id == Fixer.id)
+             .outerjoin(recent, recent.c.fixer_id == Fixer.id))
+    if fixer_ids is not None:
+        query = query.where(Fixer.id.in_(fixer_ids))
+    return {fixer_id: Decimal(balance or 0) for fixer_id, balance in db.session.execute(query)}
+
+
+def take_snapshots():
+    """Snapshots every fixer with ledger entries since their last snapshot. Returns how many were written."""
+    if db.engine.dialect.name == 'postgresql':
+        # Waits for every open transaction that has written to the ledger and
+        # holds off new entries until the snapshot commits, so every ID up to
+        # MAX(id) is committed and visible. SQLite only has one writer at a
+        # time, and it numbers a new row after every committed one.
+        db.session.execute(text("LOCK TABLE balance_ledger IN SHARE MODE"))
+    upto = db.session.scalar(select(func.max(LedgerEntry.id)))
+    if upto is None:
+        db.session.commit()
+        return 0
+    snapshot = _latest_snapshots()
+    rows = db.session.execute(
+        select(LedgerEntry.fixer_id,
+               func.coalesce(func.max(snapshot.c.balance), 0) + func.sum(LedgerEntry.amount))
+        .outerjoin(snapshot, snapshot.c.fixer_id == LedgerEntry.fixer_id)
+        .where(LedgerEntry.id > func.coalesce(snapshot.c.ledger_entry_id, 0), LedgerEntry.id <= upto)
+        .group_by(LedgerEntry.fixer_id)
+    ).all()
+    if rows:
+        db.session.execute(insert(BalanceSnapshot), [
+            {'fixer_id': fixer_id, 'ledger_entry_id': upto, 'balance': balance} for fixer_id, balance in rows
+        ])
+    db.session.commit()
+    return len(rows)
+
+
+def reconcile():
+    """Returns [(fixer_id, stored balance, ledger balance)] for every fixer whose balance disagrees with the ledger."""
+    ledger = ledger_balances()
+    stored = dict(db.session.execute(select(Fixer.id, Fixer.balance)).all())
+    return [(fixer_id, Decimal(stored[fixer_id] or 0), balance)
+            for fixer_id, balance in ledger.items()
+            if Decimal(stored[fixer_id] or 0) != balance]
@@ -0,0 +1,79 @@
+# app/metrics.py
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal in-process metrics registry. Each gunicorn worker keeps its own
+# numbers; the /metrics endpoint reports the worker that served the request.
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_gauges = {}
+
+
+def inc(name, value=1):
+    """Increments a counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    """Records one duration sample under `name`."""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            _timings[name] = {'count': 1, 'total': seconds, 'max': seconds}
+        else:
+            timing['count'] += 1
+            timing['total'] += seconds
+            if seconds > timing['max']:
+                timing['max'] = seconds
+
+
+@contextmanager
+def timed(name):
+    """Context manager that records how long its block took."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def register_gauge(name, func):
+    """Registers a callable whose current value is read whenever metrics are collected."""
+    with _lock:
+        _gauges[name] = func
+
+
+def snapshot():
+    """Returns all counters, gauges and timing summaries as plain dicts."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timings = {
+            name: {
+                'count': t['count'],
+                'total_ms': round(t['total'] * 1000, 3),
+                'avg_ms': round(t['total'] / t['count'] * 1000, 3),
+                'max_ms': round(t['max'] * 1000, 3),
+            }
+            for name, t in _timings.items()
+        }
+
+    gauge_values = {}
+    for name, func in gauges.items():
+        try:
+            gauge_values[name] = func()
+        except Exception as e:
+            print(f"WARN: Could not read gauge '{name}': {e}")
+            gauge_values[name] = None
+
+    return {'counters': counters, 'gauges': gauge_values, 'timings': timings}
+
+
+def reset():
+    """Clears counters and timings (registered gauges are kept)."""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
@@ -1,22 +1,108 @@
 # app/models.py
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from flask_login import UserMixin
 from decimal import Decimal # <-- Add this import
 import secrets # For generating secure tokens
 import hashlib
+import hmac
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
 
-db = SQLAlchemy()
+from .db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# --- NEW: Change versions for /api/sync ---
+# Every insert or update of a job or fixer stamps sync_version inside the
+# database, so a sync cursor never depends on clocks or on how long the
+# writing transaction stays open. Versions below settled_sync_version() belong
+# to transactions that have finished, so no row can still appear under them.
+#   Postgres: the writing transaction's ID, and the xmin of the current snapshot.
+#   SQLite:   one more than the highest version so far. Writers are serialised
+#             and readers only see committed data, so everything visible is settled.
+class next_sync_version(FunctionElement):
+    type = db.BigInteger()
+    inherit_cache = True
+
+class settled_sync_version(FunctionElement):
+    type = db.BigInteger()
+    inherit_cache = True
+
+_SQLITE_NEXT_SYNC_VERSION = (
+    "(SELECT COALESCE(MAX(v), 0) + 1 FROM ("
+    "SELECT MAX(sync_version) AS v FROM jobs UNION ALL SELECT MAX(sync_version) FROM fixers "
+    "UNION ALL SELECT MAX(sync_version) FROM sync_removals))"
+)
+
+@compiles(next_sync_version)
+@compiles(settled_sync_version)
+def _compile_sqlite_sync_version(element, compiler, **kw):
+    return _SQLITE_NEXT_SYNC_VERSION
+
+@compiles(next_sync_version, 'postgresql')
+def _compile_pg_next_sync_version(element, compiler, **kw):
+    return "txid_current()"
+
+@compiles(settled_sync_version, 'postgresql')
+def _compile_pg_settled_sync_version(element, compiler, **kw):
+    return "txid_snapshot_xmin(txid_current_snapshot())"
+
+# --- NEW: One-time login codes for the mobile app (see app/api_routes.py) ---
+OTP_TTL_MINUTES = 10
+# Wrong guesses allowed against one code before it is thrown away.
+OTP_MAX_ATTEMPTS = 5
+
+def _utcnow():
+    # Naive UTC, as stored in the DateTime columns.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def otp_digest(phone_number, otp):
+    """HMAC of the code, keyed with SECRET_KEY and bound to the phone number, so a leaked hash can't be brute-forced offline."""
+    key = current_app.config['SECRET_KEY'].encode('utf-8')
+    return hmac.new(key, f"{phone_number}:{otp}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+def record_failed_otp(account):
+    """Counts a wrong code against `account` and discards the code once OTP_MAX_ATTEMPTS is reached. Does not commit."""
+    model = type(account)
+    attempts = model.otp_attempts + 1
+    # One UPDATE, so concurrent guesses can't both read the old count.
+    db.session.execute(
+        db.update(model)
+        .where(model.id == account.id, model.otp_hash.isnot(None))
+        .values(otp_attempts=attempts,
+                otp_hash=db.case((attempts >= OTP_MAX_ATTEMPTS, None), else_=model.otp_hash))
+        .execution_options(synchronize_session=False)
+    )
+
+def check_otp(otp_hash, otp_expiry, phone_number, otp):
+    """Constant-time check of `otp` against a stored hash that has not expired."""
+    if not otp_hash or not otp_expiry or not otp:
+        return False
+    if otp_expiry.replace(tzinfo=None) <= _utcnow():
+        return False
+    return hmac.compare_digest(otp_hash, otp_digest(phone_number, otp))
 
 class User(db.Model, UserMixin):
     """Represents a client who interacts with the bot."""
     __tablename__ = 'users'
+    __table_args__ = (
+        # Only users mid-conversation are indexed, so the sweeper's range scan stays small.
+        db.Index('ix_users_active_conversation', 'conversation_updated_at',
+                 postgresql_where=db.text('conversation_state IS NOT NULL'),
+                 sqlite_where=db.text('conversation_state IS NOT NULL')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     phone_number = db.Column(db.String(30), unique=True, nullable=False)
     full_name = db.Column(db.String(120), nullable=True)
     is_admin = db.Column(db.Boolean, default=False, nullable=False)
     conversation_state = db.Column(db.String(50), nullable=True)
     service_request_cache = db.Column(db.String(255), nullable=True)
+    # --- NEW: Conversation activity, used to expire abandoned flows ---
+    conversation_updated_at = db.Column(db.DateTime, nullable=True)
+    conversation_nudged_at = db.Column(db.DateTime, nullable=True)
     jobs = db.relationship('Job', backref='client', lazy=True)
 
     def __repr__(self):
@@ -26,18 +112,18 @@ class User(db.Model, UserMixin):
     api_key = db.Column(db.String(64), unique=True, nullable=True, index=True)
     otp_hash = db.Column(db.String(128), nullable=True)
     otp_expiry = db.Column(db.DateTime, nullable=True)
+    otp_attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def generate_api_key(self):
         self.api_key = secrets.token_hex(32)
 
     def set_otp(self, otp):
-        self.otp_hash = hashlib.sha256(otp.encode('utf-8')).hexdigest()
-        self.otp_expiry = datetime.now(timezone.utc) + timezone.timedelta(minutes=10)
+        self.otp_hash = otp_digest(self.phone_number, otp)
+        self.otp_expiry = _utcnow() + timedelta(minutes=OTP_TTL_MINUTES)
+        self.otp_attempts = 0
 
     def verify_otp(self, otp):
-        if self.otp_expiry and self.otp_expiry > datetime.now(timezone.utc):
-            return self.otp_hash == hashlib.sha256(otp.encode('utf-8')).hexdigest()
-        return False
+        return check_otp(self.otp_hash, self.otp_expiry, self.phone_number, otp)
 
 
     # === FIX: ADDED CASCADE DELETE BEHAVIOR HERE ===
@@ -52,6 +138,10 @@ class User(db.Model, UserMixin):
 class Fixer(db.Model, UserMixin):
     """Represents a service provider (fixer)."""
     __tablename__ = 'fixers'
+    __table_args__ = (
+        # find_fixer_for_job and the admin assign dropdown filter on both columns together.
+        db.Index('ix_fixers_vetting_status_is_active', 'vetting_status', 'is_active'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(120), nullable=False)
     phone_number = db.Column(db.String(30), unique=True, nullable=False)
@@ -62,7 +152,8 @@ class Fixer(db.Model, UserMixin):
     vetting_status = db.Column(db.String(50), nullable=False, default='pending_review', server_default='pending_review')
     id_document_url = db.Column(db.String(255), nullable=True)
     vetting_notes = db.Column(db.Text, nullable=True)
-    jobs = db.relationship('Job', backref='assigned_fixer', lazy=True)
+    # Deleting a fixer leaves their jobs unassigned; the database does it (ondelete='SET NULL').
+    jobs = db.relationship('Job', backref='assigned_fixer', lazy=True, passive_deletes=True)
 
     def __repr__(self):
         return f'<Fixer {self.full_name}>'
@@ -76,28 +167,59 @@ class Fixer(db.Model, UserMixin):
     # --- NEW: Timestamp for fairness algorithm ---
     last_assigned_at = db.Column(db.DateTime, nullable=True)
 
-    jobs = db.relationship('Job', backref='assigned_fixer', lazy=True)
+    # --- NEW: Set on every ORM or Core UPDATE, for /api/sync ---
+    updated_at = db.Column(db.DateTime, nullable=False, default=_utcnow, onupdate=_utcnow)
+    sync_version = db.Column(db.BigInteger, nullable=False, server_default='0',
+                             default=next_sync_version(), onupdate=next_sync_version())
 
         # --- NEW: Fields for Mobile App Authentication ---
     api_key = db.Column(db.String(64), unique=True, nullable=True, index=True)
     otp_hash = db.Column(db.String(128), nullable=True)
     otp_expiry = db.Column(db.DateTime, nullable=True)
+    otp_attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def generate_api_key(self):
         self.api_key = secrets.token_hex(32)
 
     def set_otp(self, otp):
-        self.otp_hash = hashlib.sha256(otp.encode('utf-8')).hexdigest()
-        self.otp_expiry = datetime.now(timezone.utc) + timezone.timedelta(minutes=10)
+        self.otp_hash = otp_digest(self.phone_number, otp)
+        self.otp_expiry = _utcnow() + timedelta(minutes=OTP_TTL_MINUTES)
+        self.otp_attempts = 0
 
     def verify_otp(self, otp):
-        if self.otp_expiry and self.otp_expiry > datetime.now(timezone.utc):
-            return self.otp_hash == hashlib.sha256(otp.encode('utf-8')).hexdigest()
-        return False
+        return check_otp(self.otp_hash, self.otp_expiry, self.phone_number, otp)
 
 class Job(db.Model):
     """Represents a service request (a job)."""
     __tablename__ = 'jobs'
+    __table_args__ = (
+        # Client dashboard and job tracking: WHERE client_id = ? ORDER BY id DESC
+        db.Index('ix_jobs_client_id_id', 'client_id', 'id'),
+        # Fixer dashboard, accept/complete and location updates: WHERE fixer_id = ? [AND status = ?]
+        db.Index('ix_jobs_fixer_id_status', 'fixer_id', 'status'),
+        # Fixer dashboard job history, keyset paginated: WHERE fixer_id = ? AND id < ? ORDER BY id DESC
+        db.Index('ix_jobs_fixer_id_id', 'fixer_id', 'id'),
+        # /api/jobs, keyset paginated: WHERE client_id|fixer_id = ? AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC
+        db.Index('ix_jobs_client_id_created_at_id', 'client_id', 'created_at', 'id'),
+        db.Index('ix_jobs_fixer_id_created_at_id', 'fixer_id', 'created_at', 'id'),
+        # /api/sync: WHERE client_id|fixer_id = ? AND (sync_version, id) > (?, ?) ORDER BY sync_version, id
+        db.Index('ix_jobs_client_id_sync_version_id', 'client_id', 'sync_version', 'id'),
+        db.Index('ix_jobs_fixer_id_sync_version_id', 'fixer_id', 'sync_version', 'id'),
+        # list-jobs --status and the insight queries: WHERE status = ? ORDER BY id DESC
+        db.Index('ix_jobs_status_id', 'status', 'id'),
+        # Fixer rating average: WHERE fixer_id = ? AND rating IS NOT NULL (index-only scan)
+        db.Index('ix_jobs_fixer_id_rating', 'fixer_id', 'rating',
+                 postgresql_where=db.text('rating IS NOT NULL'),
+                 sqlite_where=db.text('rating IS NOT NULL')),
+        # Platform insights: WHERE area IS NOT NULL
+        db.Index('ix_jobs_area', 'area',
+                 postgresql_where=db.text('area IS NOT NULL'),
+                 sqlite_where=db.text('area IS NOT NULL')),
+        # backfill-job-areas: WHERE area IS NULL AND latitude IS NOT NULL ORDER BY id
+        db.Index('ix_jobs_missing_area', 'id',
+                 postgresql_where=db.text('area IS NULL AND latitude IS NOT NULL'),
+                 sqlite_where=db.text('area IS NULL AND latitude IS NOT NULL')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.Text, nullable=False)
@@ -111,17 +233,86 @@ class Job(db.Model):
     client_contact_number = db.Column(db.String(30), nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     client_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    fixer_id = db.Column(db.Integer, db.ForeignKey('fixers.id'), nullable=True)
+    fixer_id = db.Column(db.Integer, db.ForeignKey('fixers.id', ondelete='SET NULL'), nullable=True)
     rating = db.Column(db.Integer, nullable=True)
     rating_comment = db.Column(db.Text, nullable=True)
     sentiment = db.Column(db.String(50), nullable=True)
     amount = db.Column(db.Numeric(10, 2), nullable=True)
     payment_status = db.Column(db.String(50), default='unpaid', nullable=False)
     fixer_fee_status = db.Column(db.String(50), default='unpaid', nullable=False)
+    # --- NEW: Set on every ORM or Core UPDATE, for /api/sync ---
+    updated_at = db.Column(db.DateTime, nullable=False, default=_utcnow, onupdate=_utcnow)
+    sync_version = db.Column(db.BigInteger, nullable=False, server_default='0',
+                             default=next_sync_version(), onupdate=next_sync_version())
 
     def __repr__(self):
         return f'<Job {self.id} - {self.description[:20]}>'
 
+# --- NEW: Cold storage for old finished jobs (see `flask archive-jobs`) ---
+class ArchivedJob(db.Model):
+    """A complete or cancelled job moved out of `jobs` once it is old enough."""
+    __tablename__ = 'jobs_archive'
+    __table_args__ = (
+        db.Index('ix_jobs_archive_client_id_id', 'client_id', 'id'),
+        db.Index('ix_jobs_archive_fixer_id_id', 'fixer_id', 'id'),
+        db.Index('ix_jobs_archive_client_id_created_at_id', 'client_id', 'created_at', 'id'),
+        db.Index('ix_jobs_archive_fixer_id_created_at_id', 'fixer_id', 'created_at', 'id'),
+        db.Index('ix_jobs_archive_fixer_id_rating', 'fixer_id', 'rating',
+                 postgresql_where=db.text('rating IS NOT NULL'),
+                 sqlite_where=db.text('rating IS NOT NULL')),
+    )
+
+    # Keeps the ID the job had in `jobs`, so links and references stay valid.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    area = db.Column(db.String(100), nullable=True)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    client_contact_number = db.Column(db.String(30), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    fixer_id = db.Column(db.Integer, db.ForeignKey('fixers.id', ondelete='SET NULL'), nullable=True)
+    rating = db.Column(db.Integer, nullable=True)
+    rating_comment = db.Column(db.Text, nullable=True)
+    sentiment = db.Column(db.String(50), nullable=True)
+    amount = db.Column(db.Numeric(10, 2), nullable=True)
+    payment_status = db.Column(db.String(50), nullable=False)
+    fixer_fee_status = db.Column(db.String(50), nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<ArchivedJob {self.id} - {self.description[:20]}>'
+
+# Columns shared by `jobs` and `jobs_archive`, in the order used by the `jobs_all` view.
+JOB_HISTORY_COLUMNS = [
+    'id', 'description', 'status', 'area', 'latitude', 'longitude', 'client_contact_number',
+    'created_at', 'client_id', 'fixer_id', 'rating', 'rating_comment', 'sentiment', 'amount',
+    'payment_status', 'fixer_fee_status',
+]
+
+def job_history_select():
+    """SELECT ... FROM jobs UNION ALL SELECT ... FROM jobs_archive, the definition of the `jobs_all` view."""
+    return db.union_all(
+        db.select(*[Job.__table__.c[name] for name in JOB_HISTORY_COLUMNS]),
+        db.select(*[ArchivedJob.__table__.c[name] for name in JOB_HISTORY_COLUMNS]),
+    )
+
+class JobHistory(db.Model):
+    """
+    Read-only view over hot and archived jobs, for client and fixer history
+    pages and all-time figures. Filters are pushed into both halves of the
+    UNION ALL, so the per-table indexes still apply.
+    """
+    __table__ = job_history_select().subquery('jobs_all')
+    __mapper_args__ = {'primary_key': [__table__.c.id]}
+
+    client = db.relationship('User', primaryjoin='foreign(JobHistory.client_id) == User.id', viewonly=True)
+    assigned_fixer = db.relationship('Fixer', primaryjoin='foreign(JobHistory.fixer_id) == Fixer.id', viewonly=True)
+
+    def __repr__(self):
+        return f'<JobHistory {self.id} - {self.status}>'
+
 class DataInsight(db.Model):
     """Stores the generated insights from our data analysis."""
     __tablename__ = 'data_insights'
@@ -130,4 +321,115 @@ class DataInsight(db.Model):
     generated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     
     def __repr__(self):
-        return f'<DataInsight {self.id}>'
\ No newline at end of file
+        return f'<DataInsight {self.id}>'
+
+# --- NEW: Append-only record of every change to a fixer's balance (see app/ledger.py) ---
+class LedgerEntry(db.Model):
+    """One movement on a fixer's balance. Rows are never updated except to mark payouts settled."""
+    __tablename__ = 'balance_ledger'
+    __table_args__ = (
+        db.Index('ix_balance_ledger_fixer_id_id', 'fixer_id', 'id'),
+        # A job's fee can only ever be charged once.
+        db.Index('ix_balance_ledger_job_fee', 'job_id', unique=True,
+                 postgresql_where=db.text("entry_type = 'fee'"),
+                 sqlite_where=db.text("entry_type = 'fee'")),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    # RESTRICT: a fixer with balance history can't be deleted, only deactivated (see bulk_delete.delete_fixers).
+    fixer_id = db.Column(db.Integer, db.ForeignKey('fixers.id', ondelete='RESTRICT'), nullable=False)
+    # No foreign key: the job may have moved to jobs_archive.
+    job_id = db.Column(db.Integer, nullable=True)
+    entry_type = db.Column(db.String(20), nullable=False)  # 'opening', 'fee', 'topup' or 'payout'
+    amount = db.Column(db.Numeric(10, 2), nullable=False)  # Signed: fees are negative
+    note = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    # Reserved for payout processing: when the entry was paid out and in which batch.
+    settled_at = db.Column(db.DateTime, nullable=True)
+    payout_reference = db.Column(db.String(64), nullable=True)
+
+    def __repr__(self):
+        return f'<LedgerEntry {self.id} {self.entry_type} {self.amount} fixer={self.fixer_id}>'
+
+class BalanceSnapshot(db.Model):
+    """A fixer's ledger balance up to and including `ledger_entry_id`."""
+    __tablename__ = 'balance_snapshots'
+    __table_args__ = (
+        db.Index('ix_balance_snapshots_fixer_id_ledger_entry_id', 'fixer_id', 'ledger_entry_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    fixer_id = db.Column(db.Integer, db.ForeignKey('fixers.id', ondelete='RESTRICT'), nullable=False)
+    ledger_entry_id = db.Column(db.Integer, nullable=False)
+    balance = db.Column(db.Numeric(12, 2), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<BalanceSnapshot fixer={self.fixer_id} upto={self.ledger_entry_id} balance={self.balance}>'
+
+# --- NEW: PayFast ITNs, stored once per pf_payment_id and processed in the background ---
+class PaymentNotification(db.Model):
+    """A verified PayFast Instant Transaction Notification."""
+    __tablename__ = 'payment_notifications'
+    id = db.Column(db.Integer, primary_key=True)
+    pf_payment_id = db.Column(db.String(64), unique=True, nullable=False)
+    job_id = db.Column(db.Integer, nullable=True, index=True)
+    payment_status = db.Column(db.String(20), nullable=False)
+    amount_gross = db.Column(db.Numeric(10, 2), nullable=True)
+    payload = db.Column(db.Text, nullable=False)
+    # 'received' -> 'processed' | 'ignored' | 'failed'
+    status = db.Column(db.String(20), nullable=False, default='received', index=True)
+    error = db.Column(db.String(255), nullable=True)
+    received_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<PaymentNotification {self.pf_payment_id} job={self.job_id} {self.status}>'
+
+# --- NEW: Tombstones for /api/sync ---
+class SyncRemoval(db.Model):
+    """A job that left a client's or fixer's /api/sync view: reassigned, unassigned, archived or deleted."""
+    __tablename__ = 'sync_removals'
+    __table_args__ = (
+        # /api/sync: WHERE owner_type = ? AND owner_id = ? AND sync_version >= ? AND sync_version < ?
+        db.Index('ix_sync_removals_owner_type_owner_id_sync_version', 'owner_type', 'owner_id', 'sync_version'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    owner_type = db.Column(db.String(10), nullable=False)  # 'client' | 'fixer'
+    owner_id = db.Column(db.Integer, nullable=False)
+    job_id = db.Column(db.Integer, nullable=False)
+    sync_version = db.Column(db.BigInteger, nullable=False, default=next_sync_version())
+    created_at = db.Column(db.DateTime, nullable=False, default=_utcnow)
+
+    def __repr__(self):
+        return f'<SyncRemoval job={self.job_id} {self.owner_type}={self.owner_id}>'
+
+def record_sync_removals(*criteria, owners=('client', 'fixer')):
+    """Records, with one INSERT ... SELECT per owner type, that the jobs matching `criteria` are about to leave their owners' view."""
+    for owner_type in owners:
+        owner_id = Job.client_id if owner_type == 'client' else Job.fixer_id
+        db.session.execute(db.insert(SyncRemoval).from_select(
+            ['owner_type', 'owner_id', 'job_id'],
+            db.select(db.literal(owner_type), owner_id, Job.id).where(*criteria, owner_id.isnot(None)),
+        ))
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _record_job_removals(session, flush_context, instances):
+    # ORM changes only; Core DELETEs and UPDATEs (archive.py, bulk_delete.py) call record_sync_removals themselves.
+    for job in session.dirty:
+        if not isinstance(job, Job):
+            continue
+        state = db.inspect(job)
+        fixer_id, assigned_fixer = state.attrs.fixer_id.history, state.attrs.assigned_fixer.history
+        if not (fixer_id.has_changes() or assigned_fixer.has_changes()):
+            continue
+        previous = (fixer_id.deleted or fixer_id.unchanged or [None])[0]
+        if assigned_fixer.has_changes():
+            current = assigned_fixer.added[0].id if assigned_fixer.added and assigned_fixer.added[0] is not None else None
+        else:
+            current = job.fixer_id
+        if previous is not None and previous != current:
+            session.add(SyncRemoval(owner_type='fixer', owner_id=previous, job_id=job.id))
+    for job in session.deleted:
+        if isinstance(job, Job):
+            session.add(SyncRemoval(owner_type='client', owner_id=job.client_id, job_id=job.id))
+            if job.fixer_id is not None:
+                session.add(SyncRemoval(owner_type='fixer', owner_id=job.fixer_id, job_id=job.id))
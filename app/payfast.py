@@ -0,0 +1,89 @@
+# app/payfast.py
+import hashlib
+import hmac
+from decimal import Decimal, InvalidOperation
+from urllib.parse import quote_plus, urlencode
+
+# PayFast Instant Transaction Notification (ITN) helpers.
+#
+# PayFast signs an ITN by URL-encoding every posted field except `signature`,
+# in the order it was posted, joining them as a query string, appending
+# `&passphrase=...` when the merchant has one set, and taking the MD5 hex
+# digest. Verification is done locally and relies on the passphrase being
+# secret, so one must be set (PAYFAST_PASSPHRASE) for ITNs to be accepted.
+
+
+def _param_string(fields, passphrase=None):
+    pairs = [f"{key}={quote_plus(str(value).strip())}"
+             for key, value in fields if key != 'signature' and value is not None]
+    if passphrase:
+        pairs.append(f"passphrase={quote_plus(passphrase.strip())}")
+    return "&".join(pairs)
+
+
+def signature(fields, passphrase=None):
+    """MD5 signature for `fields`, a sequence of (name, value) pairs in posted order."""
+    return hashlib.md5(_param_string(fields, passphrase).encode('utf-8')).hexdigest()
+
+
+def verify_itn(fields, passphrase, merchant_id):
+    """
+    Checks an ITN's signature and merchant ID. `fields` is the posted form as
+    ordered (name, value) pairs. Returns (ok, reason).
+
+    Without a passphrase the signature is an MD5 of public fields that anyone
+    can compute, so ITNs are refused unless both a passphrase and a merchant ID
+    are configured.
+    """
+    if not passphrase:
+        return False, "PAYFAST_PASSPHRASE is not configured"
+    if not merchant_id:
+        return False, "PAYFAST_MERCHANT_ID is not configured"
+    fields = list(fields)
+    data = dict(fields)
+    received = data.get('signature', '')
+    if not received:
+        return False, "missing signature"
+    if not hmac.compare_digest(signature(fields, passphrase), received.lower()):
+        return False, "signature mismatch"
+    if data.get('merchant_id') != merchant_id:
+        return False, "unexpected merchant_id"
+    if not data.get('pf_payment_id'):
+        return False, "missing pf_payment_id"
+    return True, None
+
+
+def checkout_url(process_url, fields, passphrase=None):
+    """PayFast payment page URL for `fields`, ordered (name, value) pairs, signed the same way as an ITN."""
+    fields = [(key, str(value).strip()) for key, value in fields if value is not None]
+    fields.append(('signature', signature(fields, passphrase)))
+    return f"{process_url}?{urlencode(fields)}"
+
+
+def parse_amount(value):
+    try:
+        return Decimal(value).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError):
+        return None
+
+
+def build_itn(job_id, amount, passphrase=None, merchant_id='10000100', pf_payment_id=None,
+              payment_status='COMPLETE', item_name='FixMate-SA job'):
+    """
+    Stand-in for PayFast: builds a signed ITN body as PayFast would post it,
+    for `flask simulate-itn` and local testing. Returns ordered (name, value) pairs.
+    """
+    amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+    fee = (amount * Decimal('0.035')).quantize(Decimal('0.01'))
+    fields = [
+        ('m_payment_id', str(job_id)),
+        ('pf_payment_id', str(pf_payment_id or f"sim-{job_id}-{hashlib.md5(str(amount).encode()).hexdigest()[:8]}")),
+        ('payment_status', payment_status),
+        ('item_name', item_name),
+        ('amount_gross', f"{amount:.2f}"),
+        ('amount_fee', f"{-fee:.2f}"),
+        ('amount_net', f"{amount - fee:.2f}"),
+        ('merchant_id', merchant_id),
+    ]
+    fields.append(('signature', signature(fields, passphrase)))
+    return fields
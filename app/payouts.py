@@ -0,0 +1,118 @@
+# app/payouts.py
+import csv
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from sqlalchemy import select, update
+
+from .ledger import record_entry
+from .models import db, Fixer, LedgerEntry
+
+# Bulk payouts: every eligible fixer's balance is paid out in full, as one
+# `payout` ledger entry that brings the balance to zero, and every unsettled
+# ledger entry of that fixer is stamped with the batch's reference. The bank
+# file is written chunk by chunk, each chunk only after its transaction has
+# committed, so the file never lists a payout the database doesn't have. If
+# writing fails after a chunk committed, rebuild_payout_file writes the file
+# again from the batch's `payout` ledger entries.
+
+PAYOUT_CSV_FIELDS = ['Recipient Name', 'Bank', 'Account Number', 'Amount', 'Reference', 'Fixer ID']
+
+
+def _eligible(min_amount):
+    return (Fixer.balance >= min_amount,
+            Fixer.bank_account_holder.isnot(None),
+            Fixer.bank_account_number.isnot(None),
+            Fixer.bank_name.isnot(None))
+
+
+def _eligible_id_chunks(min_amount, chunk_size):
+    """Yields lists of eligible fixer IDs, reading with a server-side cursor where the database supports one."""
+    query = select(Fixer.id).where(*_eligible(min_amount)).order_by(Fixer.id)
+    if db.engine.dialect.name == 'postgresql':
+        # A separate connection, so the chunk transactions committing on db.session don't close the cursor.
+        with db.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+            for partition in result.partitions():
+                yield [row[0] for row in partition]
+        return
+    # SQLite and friends can't hold a read cursor open across other commits; page by ID instead.
+    last_id = 0
+    while True:
+        ids = db.session.scalars(query.where(Fixer.id > last_id).limit(chunk_size)).all()
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def reference_used(reference):
+    """True if a payout batch with this reference is already in the ledger."""
+    return db.session.scalar(
+        select(LedgerEntry.id).where(LedgerEntry.payout_reference == reference, LedgerEntry.entry_type == 'payout').limit(1)
+    ) is not None
+
+
+def rebuild_payout_file(out, reference):
+    """
+    Writes the bank CSV for an already settled batch from its `payout` ledger
+    entries, without booking anything. Bank details are the fixers' current
+    ones. Returns (fixers paid, total amount).
+    """
+    writer = csv.writer(out)
+    writer.writerow(PAYOUT_CSV_FIELDS)
+    rows = db.session.execute(
+        select(Fixer.id, Fixer.bank_account_holder, Fixer.bank_name, Fixer.bank_account_number, LedgerEntry.amount)
+        .join(LedgerEntry, LedgerEntry.fixer_id == Fixer.id)
+        .where(LedgerEntry.payout_reference == reference, LedgerEntry.entry_type == 'payout')
+        .order_by(Fixer.id)
+        .execution_options(yield_per=1000)
+    )
+    paid, total = 0, Decimal('0.00')
+    for row in rows:
+        writer.writerow([row.bank_account_holder, row.bank_name, row.bank_account_number,
+                         f"{-row.amount:.2f}", f"FixMate {reference}-{row.id}", row.id])
+        paid += 1
+        total += -row.amount
+    return paid, total
+
+
+def export_payouts(out, reference, min_amount=Decimal('0.01'), chunk_size=500, settle=True, progress=None):
+    """
+    Writes the bank bulk-payment CSV for every eligible fixer to `out` and, if
+    `settle`, books the payouts in the ledger. Returns (fixers paid, total amount).
+    """
+    writer = csv.writer(out)
+    writer.writerow(PAYOUT_CSV_FIELDS)
+    paid, total = 0, Decimal('0.00')
+    for ids in _eligible_id_chunks(min_amount, chunk_size):
+        # Lock the rows: fees and top-ups also update fixers.balance, so they wait for this chunk to commit.
+        fixers = db.session.execute(
+            select(Fixer.id, Fixer.balance, Fixer.bank_account_holder, Fixer.bank_name, Fixer.bank_account_number)
+            .where(Fixer.id.in_(ids), *_eligible(min_amount))
+            .order_by(Fixer.id)
+            .with_for_update()
+        ).all()
+        if settle and fixers:
+            settled_at = datetime.now(timezone.utc)
+            for fixer in fixers:
+                record_entry(fixer.id, 'payout', -fixer.balance, note=f"Bulk payout {reference}")
+            db.session.flush()
+            db.session.execute(
+                update(LedgerEntry)
+                .where(LedgerEntry.fixer_id.in_([fixer.id for fixer in fixers]), LedgerEntry.settled_at.is_(None))
+                .values(settled_at=settled_at, payout_reference=reference)
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+
+        for fixer in fixers:
+            writer.writerow([fixer.bank_account_holder, fixer.bank_name, fixer.bank_account_number,
+                             f"{fixer.balance:.2f}", f"FixMate {reference}-{fixer.id}", fixer.id])
+            paid += 1
+            total += fixer.balance
+        out.flush()
+        db.session.expunge_all()
+        if progress is not None:
+            progress(paid, total)
+    return paid, total
@@ -0,0 +1,160 @@
+# app/query_stats.py
+import functools
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import metrics
+
+# Counts SQL statements and database time for each request and CLI command,
+# using engine events, so N+1 patterns and slow queries show up without
+# reading code:
+#   - a statement shape run DB_N_PLUS_ONE_THRESHOLD+ times in one unit of work is reported as a suspected N+1
+#   - statements slower than DB_SLOW_QUERY_MS are logged, with parameter values redacted
+#   - in debug mode responses carry X-DB-Queries and X-DB-Time-ms headers
+# Totals are also recorded in app.metrics (db.* names) for the /metrics endpoint.
+
+SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', '200'))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('DB_N_PLUS_ONE_THRESHOLD', '5'))
+REPORT_CLI = os.environ.get('DB_QUERY_REPORT', '').lower() in ('1', 'true', 'yes')
+
+_current = ContextVar('query_stats', default=None)
+
+# Expanded IN lists (?, ?, ?) and (%(p_1)s, %(p_2)s) differ only in length; treat them as one shape.
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%s|%\([^)]+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\([^)]+\)s|:\w+)\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    return _PLACEHOLDER_LIST.sub("(...)", _WHITESPACE.sub(" ", statement).strip())
+
+
+def _redact(parameters):
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: ?" for key in parameters) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"[{len(parameters)} parameter sets]"
+        return "(" + ", ".join("?" for _ in parameters) + ")"
+    return "?"
+
+
+class QueryStats:
+    """Statements seen during one request or CLI command."""
+
+    def __init__(self, label):
+        self.label = label
+        self.count = 0
+        self.total_seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.total_seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    @property
+    def total_ms(self):
+        return self.total_seconds * 1000
+
+    def suspected_n_plus_one(self):
+        return [(shape, count) for shape, count in self.shapes.most_common()
+                if count >= N_PLUS_ONE_THRESHOLD]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started_at')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    metrics.inc('db.queries')
+    metrics.observe('db.query', elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        metrics.inc('db.slow_queries')
+        where = f" in {stats.label}" if stats is not None else ""
+        print(f"WARN: Slow query ({elapsed * 1000:.1f} ms){where}: "
+              f"{_WHITESPACE.sub(' ', statement).strip()} -- params {_redact(parameters)}", file=sys.stderr)
+
+
+def start(label):
+    stats = QueryStats(label)
+    return stats, _current.set(stats)
+
+
+def finish(stats, token):
+    """Ends a unit of work: records its totals and reports suspected N+1 statements."""
+    _current.reset(token)
+    metrics.observe('db.unit_of_work', stats.total_seconds)
+    for shape, count in stats.suspected_n_plus_one():
+        metrics.inc('db.n_plus_one_suspected')
+        print(f"WARN: Possible N+1 in {stats.label}: {count} executions of: {shape[:300]}", file=sys.stderr)
+    return stats
+
+
+def init_app(app):
+    """Tracks every request and, in debug mode, reports the totals in response headers."""
+
+    @app.before_request
+    def _start_request_stats():
+        request.environ['fixmate.query_stats'] = start(f"{request.method} {request.path}")
+
+    @app.after_request
+    def _finish_request_stats(response):
+        started = request.environ.pop('fixmate.query_stats', None)
+        if started is None:
+            return response
+        stats = finish(*started)
+        if request.endpoint:
+            metrics.observe(f"db.endpoint.{request.endpoint}", stats.total_seconds)
+        if app.debug:
+            response.headers['X-DB-Queries'] = str(stats.count)
+            response.headers['X-DB-Time-ms'] = f"{stats.total_ms:.1f}"
+        return response
+
+    @app.teardown_request
+    def _discard_request_stats(exc):
+        # after_request does not run when a view raised; don't leak the context into the next request.
+        started = request.environ.pop('fixmate.query_stats', None)
+        if started is not None:
+            finish(*started)
+
+    for command in app.cli.commands.values():
+        instrument_command(command)
+
+
+def instrument_command(command):
+    """Wraps a click command so its queries are counted like a request's."""
+    callback = command.callback
+    if callback is None or getattr(callback, '_query_stats', False):
+        return command
+
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        stats, token = start(f"flask {command.name}")
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            finish(stats, token)
+            metrics.observe(f"db.command.{command.name}", stats.total_seconds)
+            if REPORT_CLI:
+                print(f"[db] {command.name}: {stats.count} queries, {stats.total_ms:.1f} ms", file=sys.stderr)
+
+    wrapper._query_stats = True
+    command.callback = wrapper
+    return command
@@ -0,0 +1,168 @@
+# app/rate_limit.py
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import jsonify, request
+
+from . import metrics
+
+# In-process rate limiting. Each gunicorn worker counts on its own, so the
+# effective limit is up to WEB_CONCURRENCY times the configured one; the limits
+# below are about stopping floods, not exact quotas. GCRALimiter can instead
+# keep its state in Redis (RATE_LIMIT_BACKEND=redis) to share it across workers.
+
+
+class SlidingWindowLimiter:
+    """
+    Allows `limit` hits per key in any `window_seconds`, using the sliding
+    window counter approximation: the previous fixed window's count is
+    weighted by how much of it still overlaps the sliding window. Memory is
+    O(1) per key, and at most `maxsize` keys are tracked (least recently used
+    keys are dropped first).
+    """
+
+    def __init__(self, name, limit, window_seconds, maxsize=10000):
+        self.name = name
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.maxsize = maxsize
+        self._windows = OrderedDict()  # key -> [window start, count, previous count]
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """Counts one hit for `key`. Returns (allowed, retry_after_seconds)."""
+        now = time.monotonic()
+        window_start = now - now % self.window_seconds
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None:
+                state = self._windows[key] = [window_start, 0, 0]
+                if len(self._windows) > self.maxsize:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(key)
+                if state[0] != window_start:
+                    # The previous window only counts if it is the one right before this one.
+                    previous = state[1] if window_start - state[0] == self.window_seconds else 0
+                    state[:] = [window_start, 0, previous]
+            overlap = 1 - (now - window_start) / self.window_seconds
+            if state[1] + state[2] * overlap >= self.limit:
+                metrics.inc(f"rate_limit.{self.name}.rejected")
+                # Roughly when enough of the previous window will have slid out.
+                return False, max(1, int(self.window_seconds - (now - window_start)) + 1)
+            state[1] += 1
+            return True, 0
+
+    def reset(self, key):
+        with self._lock:
+            self._windows.pop(key, None)
+
+
+class GCRALimiter:
+    """
+    Generic cell rate algorithm: on average `rate` hits per `period` seconds,
+    with up to `burst` hits allowed back to back. Only one number is kept per
+    key (its theoretical arrival time), at most `maxsize` keys, LRU first.
+    """
+
+    def __init__(self, name, rate, period=60, burst=1, maxsize=10000):
+        self.name = name
+        self.emission_interval = period / rate
+        self.burst_tolerance = self.emission_interval * max(burst - 1, 0)
+        self.maxsize = maxsize
+        self._tats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _update(self, key, now):
+        with self._lock:
+            tat = max(self._tats.get(key, now), now)
+            allow_at = tat - self.burst_tolerance
+            if now < allow_at:
+                return False, allow_at - now
+            self._tats[key] = tat + self.emission_interval
+            self._tats.move_to_end(key)
+            if len(self._tats) > self.maxsize:
+                self._tats.popitem(last=False)
+            return True, 0
+
+    def hit(self, key):
+        """Counts one hit for `key`. Returns (allowed, retry_after_seconds)."""
+        allowed, wait = self._update(key, time.time())
+        if not allowed:
+            metrics.inc(f"rate_limit.{self.name}.rejected")
+            return False, max(1, int(wait + 0.999))
+        return True, 0
+
+
+class RedisGCRALimiter(GCRALimiter):
+    """GCRALimiter whose per-key state lives in Redis, shared by every worker. Fails open if Redis is unreachable."""
+
+    # Runs atomically in Redis, on Redis's clock, so workers never race or disagree about time.
+    _SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local allow_at = tat - tolerance
+if now < allow_at then return {0, tostring(allow_at - now)} end
+local new_tat = tat + interval
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000) + 1000)
+return {1, '0'}
+"""
+
+    def __init__(self, name, rate, period=60, burst=1, client=None, prefix='fixmate:ratelimit:'):
+        super().__init__(name, rate, period, burst, maxsize=0)
+        self.prefix = f"{prefix}{name}:"
+        self._script = client.register_script(self._SCRIPT)
+
+    def _update(self, key, now):
+        try:
+            allowed, wait = self._script(keys=[self.prefix + key],
+                                         args=[self.emission_interval, self.burst_tolerance])
+        except Exception as e:
+            metrics.inc(f"rate_limit.{self.name}.backend_errors")
+            print(f"WARN: Rate limiter '{self.name}' could not reach Redis, allowing the request: {e}")
+            return True, 0
+        return bool(int(allowed)), float(wait)
+
+
+def gcra_limiter_from_environment(name, rate, period=60, burst=1):
+    """A GCRALimiter, or a RedisGCRALimiter if RATE_LIMIT_BACKEND=redis and the `redis` package is installed."""
+    backend = os.environ.get('RATE_LIMIT_BACKEND', 'memory').lower()
+    if backend == 'redis':
+        try:
+            import redis
+        except ImportError:
+            print("WARN: RATE_LIMIT_BACKEND=redis but the 'redis' package is not installed. Using in-process rate limits.")
+        else:
+            url = os.environ.get('RATE_LIMIT_REDIS_URL') or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+            return RedisGCRALimiter(name, rate, period, burst, client=redis.Redis.from_url(url, socket_timeout=0.1))
+    elif backend != 'memory':
+        print(f"WARN: Unknown RATE_LIMIT_BACKEND '{backend}'. Using in-process rate limits.")
+    workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+    if workers > 1:
+        print(f"WARN: Rate limit '{name}' is per worker: with {workers} workers a client can make up to "
+              f"{workers * rate} requests per {period}s. Set RATE_LIMIT_BACKEND=redis to enforce it across workers.")
+    return GCRALimiter(name, rate, period, burst)
+
+
+def hashed_key(value):
+    """Short digest for use as a limiter key, so secrets like API keys are never stored as-is."""
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:32]
+
+
+def client_ip():
+    """The caller's IP. Behind a proxy this relies on ProxyFix (TRUSTED_PROXIES in app/config.py)."""
+    return request.remote_addr or 'unknown'
+
+
+def too_many_requests(retry_after, message='Too many requests. Please try again later.'):
+    response = jsonify({'error': message, 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
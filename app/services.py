@@ -1,8 +1,8 @@
 import os  # Add this import at the top of the file
-import requests
 import json
 
 def send_whatsapp_message(to_number, message_body=None, audio_url=None, audio_id=None):
+    import requests  # deferred so importing the app stays fast
     print("--- Attempting to send WhatsApp message ---")
 
     # Get API key and URL from environment variables
@@ -0,0 +1,118 @@
+# app/state_machine.py
+import time
+
+from . import metrics
+
+NEW_CONVERSATION = None
+
+
+class ConversationMachineError(Exception):
+    """Raised when a conversation flow is declared inconsistently."""
+
+
+class MessageContext:
+    """What a state handler gets to work with for one inbound message."""
+
+    def __init__(self, conversation, from_number, text="", location=None):
+        self.conversation = conversation
+        self.from_number = from_number
+        self.text = text or ""
+        self.location = location
+
+
+def has_text(ctx):
+    return bool(ctx.text)
+
+
+def has_location(ctx):
+    return ctx.location is not None
+
+
+class _StateSpec:
+    def __init__(self, name, handler, transitions, accepts):
+        self.name = name
+        self.handler = handler
+        self.transitions = frozenset(transitions)
+        self.accepts = accepts
+
+
+def _label(state):
+    return state if state is not None else 'new'
+
+
+class ConversationMachine:
+    """
+    Declarative registry for a WhatsApp conversation flow.
+
+    Each state has one handler, registered with the states it may move the
+    conversation to. Messages are dispatched with a dict lookup instead of an
+    if/elif chain. When a state's `accepts` check fails (e.g. text arrives
+    while a location pin is expected) the message goes to the default
+    handler, which also handles users with no state at all.
+
+    Handler latency and every transition are recorded in app.metrics under
+    `conversation.<flow>.state.<state>` and `conversation.<flow>.transition.<from>-><to>`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._states = {}
+        self._default = None
+
+    def state(self, name, transitions=(), accepts=None):
+        """Decorator registering the handler for `name`. Use None in `transitions` for a cleared state."""
+        def register(handler):
+            if name in self._states:
+                raise ConversationMachineError(f"State '{name}' is registered twice in the '{self.name}' flow.")
+            self._states[name] = _StateSpec(name, handler, transitions, accepts)
+            return handler
+        return register
+
+    def default(self, transitions=(), accepts=None):
+        """Decorator registering the handler for new conversations and unmatched messages."""
+        def register(handler):
+            if self._default is not None:
+                raise ConversationMachineError(f"The '{self.name}' flow already has a default handler.")
+            self._default = _StateSpec(NEW_CONVERSATION, handler, transitions, accepts)
+            return handler
+        return register
+
+    @property
+    def states(self):
+        return set(self._states)
+
+    def validate(self):
+        """Checks at startup that every declared transition targets a registered state."""
+        if self._default is None:
+            raise ConversationMachineError(f"The '{self.name}' flow has no default handler.")
+        for spec in list(self._states.values()) + [self._default]:
+            for target in spec.transitions:
+                if target is not NEW_CONVERSATION and target not in self._states:
+                    raise ConversationMachineError(
+                        f"State '{_label(spec.name)}' in the '{self.name}' flow declares a "
+                        f"transition to unknown state '{target}'."
+                    )
+        return self
+
+    def dispatch(self, ctx):
+        """Runs the handler for the conversation's current state and returns its reply."""
+        current_state = ctx.conversation.state
+        spec = self._states.get(current_state)
+        if spec is None or (spec.accepts is not None and not spec.accepts(ctx)):
+            spec = self._default
+        if spec.accepts is not None and not spec.accepts(ctx):
+            return None
+
+        start = time.perf_counter()
+        try:
+            reply = spec.handler(ctx)
+        finally:
+            metrics.observe(f"conversation.{self.name}.state.{_label(spec.name)}", time.perf_counter() - start)
+
+        new_state = ctx.conversation.state
+        metrics.inc(f"conversation.{self.name}.transition.{_label(current_state)}->{_label(new_state)}")
+        if new_state != current_state and new_state not in spec.transitions:
+            metrics.inc(f"conversation.{self.name}.undeclared_transitions")
+            print(f"WARN: Undeclared transition in '{self.name}' flow: "
+                  f"{_label(spec.name)} moved the conversation to {_label(new_state)}.")
+        return reply
@@ -0,0 +1,67 @@
+# app/stats.py
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from .cache import TTLCache
+from .models import db, User, Fixer, JobHistory, LedgerEntry
+
+_summary_cache = TTLCache(maxsize=1, ttl_seconds=60)
+
+
+def platform_summary():
+    """
+    Computes the platform statistics shown by `flask stats` and the admin
+    summary panel. All job figures, archived jobs included, come from one
+    GROUP BY over (status, sentiment); user and fixer totals and fee revenue
+    come from one more round trip.
+    """
+    rows = db.session.execute(
+        select(JobHistory.status,
+               JobHistory.sentiment,
+               func.count(JobHistory.id),
+               func.count(JobHistory.rating),
+               func.coalesce(func.sum(JobHistory.rating), 0))
+        .group_by(JobHistory.status, JobHistory.sentiment)
+    ).all()
+
+    jobs_by_status, sentiment_counts = {}, {}
+    total_jobs = rated_jobs = rating_sum = 0
+    for status, sentiment, count, rating_count, status_rating_sum in rows:
+        jobs_by_status[status] = jobs_by_status.get(status, 0) + count
+        if sentiment:
+            sentiment_counts[sentiment] = sentiment_counts.get(sentiment, 0) + count
+        total_jobs += count
+        rated_jobs += rating_count
+        rating_sum += status_rating_sum
+
+    # Fees are booked as negative ledger entries, so revenue is what was actually
+    # charged, whatever the fee was at the time and however many jobs completed.
+    user_count, fixer_count, fees_charged = db.session.execute(
+        select(select(func.count(User.id)).scalar_subquery(),
+               select(func.count(Fixer.id)).scalar_subquery(),
+               select(func.coalesce(func.sum(LedgerEntry.amount), 0))
+               .where(LedgerEntry.entry_type == 'fee').scalar_subquery())
+    ).one()
+
+    return {
+        'user_count': user_count,
+        'fixer_count': fixer_count,
+        'job_count': total_jobs,
+        'jobs_by_status': dict(sorted(jobs_by_status.items(), key=lambda item: -item[1])),
+        'sentiment_counts': dict(sorted(sentiment_counts.items(), key=lambda item: -item[1])),
+        'rated_jobs': rated_jobs,
+        'average_rating': round(rating_sum / rated_jobs, 2) if rated_jobs else None,
+        'fee_revenue': -Decimal(fees_charged),
+    }
+
+
+def cached_platform_summary(ttl_seconds=None):
+    """Returns `platform_summary`, recomputed at most once per TTL window in each process."""
+    if ttl_seconds is not None:
+        _summary_cache.ttl_seconds = ttl_seconds
+    return _summary_cache.get_or_set('summary', platform_summary)
+
+
+def invalidate_platform_summary():
+    _summary_cache.clear()
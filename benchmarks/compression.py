@@ -0,0 +1,92 @@
+# benchmarks/compression.py
+"""
+Bytes on the wire and CPU time for a typical /api/jobs page and a dashboard-
+sized HTML table, uncompressed vs gzip (and brotli if installed), plus JSON
+serialisation time with Flask's default provider vs ORJSONProvider.
+
+    python benchmarks/compression.py
+    python benchmarks/compression.py --jobs 200 --repeat 500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from app import compression  # noqa: E402
+from app.json_provider import ORJSONProvider, orjson  # noqa: E402
+
+DESCRIPTIONS = ['Leaking pipe under the kitchen sink', 'Geyser not heating', 'Replace DB board breaker',
+                'Install ceiling fan in bedroom', 'Blocked drain outside', 'Gate motor stuck half open']
+STATUSES = ['awaiting_payment', 'assigned', 'accepted', 'complete', 'cancelled']
+AREAS = ['Soweto', 'Sandton', 'Hatfield', 'Centurion', 'Mamelodi', 'Soshanguve', 'Midrand']
+
+
+def sample_jobs(n):
+    rng = random.Random(42)
+    start = datetime(2026, 1, 1)
+    return [{
+        'id': 100000 + i, 'description': rng.choice(DESCRIPTIONS), 'status': rng.choice(STATUSES),
+        'area': rng.choice(AREAS), 'created_at': start + timedelta(minutes=37 * i),
+        'amount': Decimal(rng.randrange(150, 2500)).quantize(Decimal('0.01')),
+        'payment_status': rng.choice(['paid', 'unpaid']), 'rating': rng.choice([None, 3, 4, 5]),
+    } for i in range(n)]
+
+
+def sample_html(jobs):
+    rows = "".join(
+        f"<tr><td>#{job['id']}</td><td>{job['description']}</td><td>{job['area']}</td>"
+        f"<td><span class=\"badge bg-secondary\">{job['status']}</span></td><td>R{job['amount']}</td>"
+        f"<td><a class=\"btn btn-sm btn-outline-primary\" href=\"/track/{job['id']}\">Track</a></td></tr>\n"
+        for job in jobs)
+    return (f"<!DOCTYPE html><html><head><title>Dashboard</title></head><body><table class=\"table table-striped\">"
+            f"<thead><tr><th>ID</th><th>Job</th><th>Area</th><th>Status</th><th>Amount</th><th></th></tr></thead>"
+            f"<tbody>\n{rows}</tbody></table></body></html>").encode('utf-8')
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=50, help='Jobs per payload (the /api/jobs page size).')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    jobs = sample_jobs(args.jobs)
+    payload = {'jobs': jobs, 'next_cursor': 'MjAyNi0wMS0wMVQwMjowMDowMHw1'}
+
+    print(f"=== JSON serialisation ({args.jobs} jobs) ===")
+    with app.app_context():
+        body, default_ms = timed(lambda: DefaultJSONProvider(app).response(payload).get_data(), args.repeat)
+        print(f"  default provider: {default_ms:.3f} ms")
+        if orjson is not None:
+            _, orjson_ms = timed(lambda: ORJSONProvider(app).response(payload).get_data(), args.repeat)
+            print(f"  ORJSONProvider:   {orjson_ms:.3f} ms ({default_ms / orjson_ms:.1f}x)")
+        else:
+            print("  ORJSONProvider:   skipped (orjson not installed)")
+
+    encodings = ['gzip'] + (['br'] if compression.brotli is not None else [])
+    for name, data in (('/api/jobs JSON', body), ('dashboard HTML', sample_html(jobs))):
+        print(f"\n=== {name} ===")
+        print(f"  identity: {len(data):>8} bytes")
+        for encoding in encodings:
+            compressed, ms = timed(lambda: compression.compress(data, encoding), args.repeat)
+            print(f"  {encoding:<8}: {len(compressed):>8} bytes ({len(compressed) / len(data):.0%}), {ms:.3f} ms to compress")
+    if compression.brotli is None:
+        print("\n(brotli not installed; only gzip measured)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# benchmarks/otp_verify.py
+"""
+Times the in-process part of POST /api/verify_otp: both rate limiter checks
+and the constant-time code comparison. The account lookup is left out, so the
+numbers show what the endpoint adds on top of one indexed query.
+
+    python benchmarks/otp_verify.py
+    python benchmarks/otp_verify.py --phones 100000 --attempts 500000 --threads 8
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import timedelta
+
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from app.models import _utcnow, check_otp, otp_digest  # noqa: E402
+from app.rate_limit import SlidingWindowLimiter  # noqa: E402
+
+
+def run(app, phones, attempts, threads):
+    ip_limit = SlidingWindowLimiter('bench_ip', limit=30, window_seconds=600, maxsize=phones)
+    phone_limit = SlidingWindowLimiter('bench_phone', limit=5, window_seconds=600, maxsize=phones)
+    numbers = [f"whatsapp:+2771{i:07d}" for i in range(phones)]
+    expiry = _utcnow() + timedelta(minutes=10)
+    with app.app_context():
+        stored = {phone: otp_digest(phone, '123456') for phone in numbers}
+    samples = []
+    lock = threading.Lock()
+
+    def worker(count):
+        rng = random.Random()
+        local = []
+        # Each request thread has its own app context, as it would under gunicorn.
+        with app.app_context():
+            for _ in range(count):
+                phone = rng.choice(numbers)
+                otp = '123456' if rng.random() < 0.5 else f"{rng.randrange(1000000):06d}"
+                start = time.perf_counter()
+                ip_limit.hit(f"10.0.{rng.randrange(256)}.{rng.randrange(256)}")
+                phone_limit.hit(phone)
+                check_otp(stored[phone], expiry, phone, otp)
+                local.append(time.perf_counter() - start)
+        with lock:
+            samples.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(attempts // threads,)) for _ in range(threads)]
+    wall = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    wall = time.perf_counter() - wall
+
+    samples.sort()
+    us = lambda seconds: seconds * 1_000_000  # noqa: E731
+    print(f"{len(samples)} verifications over {phones} phone numbers, {threads} thread(s), {wall:.2f}s wall")
+    print(f"  mean {us(statistics.fmean(samples)):.1f} us   p50 {us(samples[len(samples) // 2]):.1f} us   "
+          f"p99 {us(samples[int(len(samples) * 0.99)]):.1f} us   max {us(samples[-1]):.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--phones', type=int, default=10_000)
+    parser.add_argument('--attempts', type=int, default=200_000)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'benchmark-secret'
+    run(app, args.phones, args.attempts, args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# benchmarks/query_plans.py
+"""
+Seeds a throwaway database with realistic volumes and reports the query plan
+and timing of run.py's hot queries against the baseline schema's indexes
+(before) and against every index the models define today (after).
+
+Each round drops or creates the added indexes, runs ANALYZE, warms every
+query up and then times it. Rounds alternate before/after and the median is
+reported, so neither side benefits from a warmer cache. Queries whose plan
+is the same either way are marked as such rather than given a speedup.
+
+    python benchmarks/query_plans.py                       # SQLite file, 1M jobs
+    python benchmarks/query_plans.py --url postgresql://localhost/fixmate_bench --jobs 1000000
+
+Never point --url at a real database: all tables are dropped and recreated.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import Session, joinedload
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from app.models import db, Fixer, Job, JobHistory, User  # noqa: E402
+
+# The only indexes the schema had before the hot path work (unique constraints are kept as well).
+BASELINE_INDEXES = {'ix_users_api_key', 'ix_fixers_api_key'}
+# Page sizes run.py uses by default (CLIENT_PAGE_SIZE, FIXER_PAGE_SIZE); keyset_page fetches one extra row.
+PAGE_SIZE = 20
+FIXER_ACTIVE_JOB_STATUSES = ['assigned', 'accepted']
+STATUSES = ['unassigned', 'assigned', 'accepted', 'complete', 'complete', 'complete', 'cancelled']
+AREAS = ['Soweto', 'Sandton', 'Hatfield', 'Centurion', 'Mamelodi', 'Soshanguve', 'Midrand', None]
+
+
+def hot_queries(client_id, fixer_id, candidate_ids):
+    """The queries from run.py that run on every dashboard view, job action or matching call."""
+    return {
+        'dashboard (client job history)': select(JobHistory).options(joinedload(JobHistory.assigned_fixer))
+        .where(JobHistory.client_id == client_id).order_by(JobHistory.id.desc()).limit(PAGE_SIZE + 1),
+        'fixer_dashboard (history page)': select(JobHistory).options(joinedload(JobHistory.client))
+        .where(JobHistory.fixer_id == fixer_id, JobHistory.status.notin_(FIXER_ACTIVE_JOB_STATUSES))
+        .order_by(JobHistory.id.desc()).limit(PAGE_SIZE + 1),
+        'fixer_dashboard (active jobs)': select(Job).options(joinedload(Job.client))
+        .where(Job.fixer_id == fixer_id, Job.status.in_(FIXER_ACTIVE_JOB_STATUSES)).order_by(Job.id.desc()),
+        'accept_job (fixer + id)': select(Job.id).where(Job.id == 12345, Job.fixer_id == fixer_id),
+        'list-jobs --status': select(Job.id).where(Job.status == 'accepted').order_by(Job.id.desc()).limit(100),
+        'find_fixer_for_job (eligible)': select(Fixer.id).where(Fixer.is_active == True,  # noqa: E712
+                                                                Fixer.vetting_status == 'approved'),
+        'find_fixer_for_job (avg ratings)': select(JobHistory.fixer_id, func.avg(JobHistory.rating))
+        .where(JobHistory.fixer_id.in_(candidate_ids), JobHistory.rating.isnot(None))
+        .group_by(JobHistory.fixer_id),
+        'generate_platform_insights': select(func.count()).select_from(Job).where(Job.area.isnot(None)),
+        'backfill-job-areas (next batch)': select(Job.id).where(Job.id > 0, Job.area.is_(None),
+                                                                Job.latitude.isnot(None)).order_by(Job.id).limit(500),
+    }
+
+
+def seed(engine, n_users, n_fixers, n_jobs, batch=20000):
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {'id': i, 'phone_number': f'whatsapp:+2782{i:07d}', 'is_admin': False} for i in range(1, n_users + 1)
+        ])
+        conn.execute(Fixer.__table__.insert(), [
+            {'id': i, 'full_name': f'Fixer {i}', 'phone_number': f'whatsapp:+2783{i:07d}',
+             'skills': rng.choice(['plumbing', 'electrical', 'general handyman']),
+             'is_active': rng.random() < 0.8,
+             'vetting_status': rng.choice(['approved', 'approved', 'pending_review', 'rejected']),
+             'balance': 0}
+            for i in range(1, n_fixers + 1)
+        ])
+    for start in range(1, n_jobs + 1, batch):
+        rows = []
+        for i in range(start, min(start + batch, n_jobs + 1)):
+            status = rng.choice(STATUSES)
+            rows.append({
+                'id': i, 'description': 'Leaking pipe under sink', 'status': status,
+                'area': rng.choice(AREAS), 'latitude': -25.7 + rng.random(), 'longitude': 28.2 + rng.random(),
+                'created_at': now - timedelta(minutes=n_jobs - i),
+                'client_id': rng.randint(1, n_users),
+                'fixer_id': rng.randint(1, n_fixers) if status != 'unassigned' else None,
+                'rating': rng.randint(1, 5) if status == 'complete' and rng.random() < 0.6 else None,
+                'payment_status': 'unpaid', 'fixer_fee_status': 'unpaid',
+            })
+        with engine.begin() as conn:
+            conn.execute(Job.__table__.insert(), rows)
+        print(f"  seeded {min(start + batch - 1, n_jobs)}/{n_jobs} jobs", end='\r')
+    print()
+
+
+def explain(conn, statement):
+    compiled = statement.compile(conn, compile_kwargs={'literal_binds': True})
+    if conn.dialect.name == 'sqlite':
+        return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))]
+    return [row[0] for row in conn.execute(text(f"EXPLAIN {compiled}"))]
+
+
+def set_indexes(engine, indexes, present):
+    """Creates or drops `indexes`, then refreshes the planner statistics."""
+    with engine.begin() as conn:
+        for index in indexes:
+            if present:
+                index.create(conn)
+            else:
+                index.drop(conn)
+        conn.execute(text("ANALYZE"))
+
+
+def measure(engine, queries, repeat, warmup):
+    """Returns {name: (plan, mean ms per execution)}, timing each query only after `warmup` untimed runs."""
+    results = {}
+    with Session(engine) as session:
+        for name, statement in queries.items():
+            plan = explain(session.connection(), statement)
+            for _ in range(warmup):
+                session.execute(statement).all()
+                session.expunge_all()
+            start = time.perf_counter()
+            for _ in range(repeat):
+                session.execute(statement).all()
+                session.expunge_all()
+            results[name] = (plan, (time.perf_counter() - start) / repeat * 1000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='sqlite:///bench_query_plans.db')
+    parser.add_argument('--jobs', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--fixers', type=int, default=2_000)
+    parser.add_argument('--repeat', type=int, default=20, help='Timed executions per query and round.')
+    parser.add_argument('--warmup', type=int, default=3, help='Untimed executions per query before timing.')
+    parser.add_argument('--rounds', type=int, default=3, help='Before/after rounds; the median is reported.')
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    metadata = db.metadata
+    added_indexes = [index for table in metadata.sorted_tables for index in table.indexes
+                     if index.name not in BASELINE_INDEXES]
+
+    print(f"Recreating schema at {engine.url.render_as_string(hide_password=True)} ...")
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        for index in added_indexes:
+            index.drop(conn)
+
+    print(f"Seeding {args.users} users, {args.fixers} fixers and {args.jobs} jobs ...")
+    seed(engine, args.users, args.fixers, args.jobs)
+
+    fixer_id = args.fixers // 2
+    queries = hot_queries(client_id=args.users // 2, fixer_id=fixer_id,
+                          candidate_ids=list(range(fixer_id, min(fixer_id + 50, args.fixers + 1))))
+    plans = {'before': {}, 'after': {}}
+    timings = {'before': {name: [] for name in queries}, 'after': {name: [] for name in queries}}
+    set_indexes(engine, [], present=False)  # Seeded without the added indexes; only ANALYZE.
+    indexes_present = False
+    for round_number in range(1, args.rounds + 1):
+        for side, present in (('before', False), ('after', True)):
+            print(f"Round {round_number}/{args.rounds}: {side} ...")
+            if present != indexes_present:
+                set_indexes(engine, added_indexes, present)
+                indexes_present = present
+            for name, (plan, ms) in measure(engine, queries, args.repeat, args.warmup).items():
+                plans[side].setdefault(name, plan)
+                timings[side][name].append(ms)
+
+    for name in queries:
+        plan_before, plan_after = plans['before'][name], plans['after'][name]
+        ms_before = statistics.median(timings['before'][name])
+        ms_after = statistics.median(timings['after'][name])
+        if plan_before == plan_after:
+            print(f"\n=== {name}: {ms_before:.3f} ms -> {ms_after:.3f} ms (same plan)")
+            print("  plan:   " + "\n          ".join(plan_after))
+            continue
+        print(f"\n=== {name}: {ms_before:.3f} ms -> {ms_after:.3f} ms ({ms_before / max(ms_after, 1e-6):.1f}x)")
+        print("  before: " + "\n          ".join(plan_before))
+        print("  after:  " + "\n          ".join(plan_after))
+
+
+if __name__ == '__main__':
+    main()
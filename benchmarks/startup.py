@@ -0,0 +1,123 @@
+# benchmarks/startup.py
+"""
+Measures how long the app takes to become ready, each in fresh processes:
+
+  * the `import run` time, and the first and second request through the test client
+  * what the deferred imports (Gemini, geopy, requests) would have added to it
+  * with --gunicorn: time from starting gunicorn until every worker has
+    served a request, with and without preload_app
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 10 --gunicorn --workers 4
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+COLD_START = """
+import sys, time
+start = time.perf_counter()
+import run
+imported = time.perf_counter()
+client = run.app.test_client()
+client.get('/')
+first = time.perf_counter()
+client.get('/')
+second = time.perf_counter()
+print(imported - start, first - imported, second - first)
+"""
+
+IMPORT_ONE = "import sys, time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+DEFERRED_MODULES = ['google.generativeai', 'geopy.distance', 'requests']
+
+
+def python(code, env):
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise SystemExit(output.stderr)
+    return [float(value) for value in output.stdout.strip().splitlines()[-1].split()]
+
+
+def ms(values):
+    return f"median {statistics.median(values) * 1000:7.1f} ms   min {min(values) * 1000:7.1f} ms"
+
+
+def gunicorn_ready(env, workers, preload, port):
+    """Seconds from launch until each of `workers` distinct workers has answered a request."""
+    env = dict(env, GUNICORN_PRELOAD='1' if preload else '0', WEB_CONCURRENCY=str(workers))
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'run:app', '-b', f"127.0.0.1:{port}",
+         '--access-logfile', '-', '--access-logformat', 'served-by %(p)s'],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    ready = {}
+    done = threading.Event()
+
+    def read_access_log():
+        for line in server.stdout:
+            if line.startswith('served-by'):
+                ready.setdefault(line.split()[1], time.perf_counter() - start)
+                if len(ready) >= workers:
+                    done.set()
+
+    def hammer():
+        while not done.is_set():
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=2).read()
+            except OSError:
+                time.sleep(0.01)
+
+    threading.Thread(target=read_access_log, daemon=True).start()
+    clients = [threading.Thread(target=hammer, daemon=True) for _ in range(workers * 2)]
+    for client in clients:
+        client.start()
+    done.wait(timeout=60)
+    server.terminate()
+    server.wait()
+    return sorted(ready.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--gunicorn', action='store_true', help='Also time real gunicorn workers.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'startup.db')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", PYTHONWARNINGS='ignore')
+
+    runs = [python(COLD_START, env) for _ in range(args.runs)]
+    print(f"=== Cold start ({args.runs} fresh processes) ===")
+    print(f"  import run:      {ms([r[0] for r in runs])}")
+    print(f"  first request:   {ms([r[1] for r in runs])}")
+    print(f"  second request:  {ms([r[2] for r in runs])}")
+
+    print("\n=== Deferred imports (paid on first use instead of at startup) ===")
+    for module in DEFERRED_MODULES:
+        try:
+            times = [python(IMPORT_ONE.format(module=module), env)[0] for _ in range(args.runs)]
+        except SystemExit:
+            print(f"  {module:<20} not installed")
+            continue
+        print(f"  {module:<20} {ms(times)}")
+
+    if args.gunicorn:
+        print(f"\n=== gunicorn, {args.workers} worker(s): seconds until each worker served a request ===")
+        for preload in (False, True):
+            ready = gunicorn_ready(env, args.workers, preload, args.port)
+            label = 'preload' if preload else 'no preload'
+            print(f"  {label:<11} " + "  ".join(f"{seconds:.2f}s" for seconds in ready))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+# gunicorn.conf.py
+# Picked up automatically by `gunicorn run:app` (see Procfile).
+import os
+import sys
+
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# app/db_engine.py sizes each worker's connection pool from the same variable.
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+# Import run.py once in the master and fork workers from it: workers start
+# faster and share the imported code's memory. This is safe because nothing
+# fork-unsafe is created at import time: the Gemini client (grpc) is imported on
+# first use (app/gemini.py), the background pool is created per process, and
+# the database pools are emptied in post_fork below. GUNICORN_PRELOAD=0 turns it off.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() in ('1', 'true', 'yes')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+
+
+def post_fork(server, worker):
+    # With preload_app the app, and its database engines, were created in the
+    # master. Connections must not be shared across processes, so each worker
+    # starts with empty pools.
+    run = sys.modules.get('run')
+    if run is None:
+        return
+    from app.db_engine import dispose_engines_after_fork
+    with run.app.app_context():
+        dispose_engines_after_fork(run.db.engines)
@@ -0,0 +1,51 @@
+"""Add hot path indexes to jobs and fixers
+
+Revision ID: 4c1e9b7d2f63
+Revises: 8d3f5a2c7e19
+Create Date: 2026-10-19 11:26:05.930716
+
+Chosen from EXPLAIN output for every query in run.py; see
+benchmarks/query_plans.py for the before/after plans and timings.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1e9b7d2f63'
+down_revision = '8d3f5a2c7e19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.create_index('ix_jobs_client_id_id', ['client_id', 'id'], unique=False)
+        batch_op.create_index('ix_jobs_fixer_id_status', ['fixer_id', 'status'], unique=False)
+        batch_op.create_index('ix_jobs_status_id', ['status', 'id'], unique=False)
+        batch_op.create_index('ix_jobs_fixer_id_rating', ['fixer_id', 'rating'], unique=False,
+                              postgresql_where=sa.text('rating IS NOT NULL'),
+                              sqlite_where=sa.text('rating IS NOT NULL'))
+        batch_op.create_index('ix_jobs_area', ['area'], unique=False,
+                              postgresql_where=sa.text('area IS NOT NULL'),
+                              sqlite_where=sa.text('area IS NOT NULL'))
+        batch_op.create_index('ix_jobs_missing_area', ['id'], unique=False,
+                              postgresql_where=sa.text('area IS NULL AND latitude IS NOT NULL'),
+                              sqlite_where=sa.text('area IS NULL AND latitude IS NOT NULL'))
+
+    with op.batch_alter_table('fixers', schema=None) as batch_op:
+        batch_op.create_index('ix_fixers_vetting_status_is_active', ['vetting_status', 'is_active'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('fixers', schema=None) as batch_op:
+        batch_op.drop_index('ix_fixers_vetting_status_is_active')
+
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_jobs_missing_area')
+        batch_op.drop_index('ix_jobs_area')
+        batch_op.drop_index('ix_jobs_fixer_id_rating')
+        batch_op.drop_index('ix_jobs_status_id')
+        batch_op.drop_index('ix_jobs_fixer_id_status')
+        batch_op.drop_index('ix_jobs_client_id_id')
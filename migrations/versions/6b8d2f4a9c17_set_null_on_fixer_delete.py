@@ -0,0 +1,31 @@
+"""Set jobs.fixer_id to NULL when a fixer is deleted
+
+Revision ID: 6b8d2f4a9c17
+Revises: 9a7c3e5b1d24
+Create Date: 2026-10-19 14:10:52.604381
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '6b8d2f4a9c17'
+down_revision = '9a7c3e5b1d24'
+branch_labels = None
+depends_on = None
+
+# Postgres named the constraint jobs_fixer_id_fkey itself. SQLite reflects it
+# unnamed, so batch mode gets the same name from this convention.
+NAMING_CONVENTION = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+
+def upgrade():
+    with op.batch_alter_table('jobs', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint('jobs_fixer_id_fkey', type_='foreignkey')
+        batch_op.create_foreign_key('jobs_fixer_id_fkey', 'fixers', ['fixer_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('jobs', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint('jobs_fixer_id_fkey', type_='foreignkey')
+        batch_op.create_foreign_key('jobs_fixer_id_fkey', 'fixers', ['fixer_id'], ['id'])
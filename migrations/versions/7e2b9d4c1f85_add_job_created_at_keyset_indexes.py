@@ -0,0 +1,35 @@
+"""Add (owner, created_at, id) indexes for /api/jobs
+
+Revision ID: 7e2b9d4c1f85
+Revises: a4d7b2e9c051
+Create Date: 2026-10-19 18:12:09.554021
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7e2b9d4c1f85'
+down_revision = 'a4d7b2e9c051'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.create_index('ix_jobs_client_id_created_at_id', ['client_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_jobs_fixer_id_created_at_id', ['fixer_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('jobs_archive', schema=None) as batch_op:
+        batch_op.create_index('ix_jobs_archive_client_id_created_at_id', ['client_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_jobs_archive_fixer_id_created_at_id', ['fixer_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('jobs_archive', schema=None) as batch_op:
+        batch_op.drop_index('ix_jobs_archive_fixer_id_created_at_id')
+        batch_op.drop_index('ix_jobs_archive_client_id_created_at_id')
+
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_jobs_fixer_id_created_at_id')
+        batch_op.drop_index('ix_jobs_client_id_created_at_id')
@@ -0,0 +1,25 @@
+"""Add fixer job history index
+
+Revision ID: 9a7c3e5b1d24
+Revises: 4c1e9b7d2f63
+Create Date: 2026-10-19 13:02:41.118204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9a7c3e5b1d24'
+down_revision = '4c1e9b7d2f63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.create_index('ix_jobs_fixer_id_id', ['fixer_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_jobs_fixer_id_id')
@@ -3,66 +3,83 @@ import os
 import re
 from urllib.parse import urlparse # <-- ADD THIS LINE
 import hashlib
-import requests
+import hmac
 import io
+import csv
 import json
+import sys
 import threading # <--- ADD THIS
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
 from decimal import Decimal
 from urllib.parse import urlencode
-from flask import Flask, request, Response, render_template, redirect, url_for, flash, session, jsonify
+from flask import Flask, request, Response, render_template, redirect, url_for, flash, session, jsonify, has_request_context
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from itsdangerous import URLSafeTimedSerializer
+from sqlalchemy.orm import joinedload
+from flask_login import login_user, logout_user, login_required, current_user
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 import click
-import google.generativeai as genai
-from geopy.distance import geodesic
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from app.services import send_whatsapp_message
+from app.conversation import ConversationSession
+from app.state_machine import ConversationMachine, MessageContext, has_location, has_text
+from app import create_app, metrics, query_stats
+from app.gemini import gemini
+from app.archive import archive_jobs, count_archivable
+from app.ledger import complete_job_and_charge_fee, record_entry, reconcile, take_snapshots
+from app.payouts import export_payouts, rebuild_payout_file, reference_used
+from app.bulk_delete import count_clients, count_fixers, count_fixers_with_ledger_history, delete_clients, delete_fixers
+from app.cache import TTLCache
+from app import background, payfast
+from app.db_routing import read_only
+from app.stats import platform_summary, cached_platform_summary, invalidate_platform_summary
+from app.geocoding import build_area_index, load_area_index, resolve_area, nominatim_throttle
 import tempfile
 from werkzeug.utils import secure_filename
 
 
 
 # --- App Initialization & Config ---
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'a-very-secret-key-that-is-long-and-random')
-db_url = os.environ.get('DATABASE_URL')
-if db_url and db_url.startswith("postgres://"):
-    db_url = db_url.replace("postgres://", "postgresql://", 1)
-app.config['SQLALCHEMY_DATABASE_URI'] = db_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app = create_app()
 
 # --- API Keys & Constants Configuration ---
 PAYFAST_MERCHANT_ID = os.environ.get('PAYFAST_MERCHANT_ID')
 PAYFAST_MERCHANT_KEY = os.environ.get('PAYFAST_MERCHANT_KEY')
 PAYFAST_URL = 'https://sandbox.payfast.co.za/eng/process'
+PAYFAST_PASSPHRASE = os.environ.get('PAYFAST_PASSPHRASE')
+PAYMENT_LINK_MAX_AGE = 7 * 24 * 60 * 60  # seconds a payment link's cancel URL stays valid
+if not (PAYFAST_PASSPHRASE and PAYFAST_MERCHANT_ID):
+    print("WARN: PAYFAST_PASSPHRASE and PAYFAST_MERCHANT_ID must both be set; until then every PayFast ITN is rejected.")
 DIALOG_360_URL = 'https://waba-v2.360dialog.io/messages'
 DIALOG_360_API_KEY = os.environ.get('DIALOG_360_API_KEY') # <-- ADD THIS LINE
-GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')  # the client itself is imported on first use (app/gemini.py)
 
 FIXER_JOB_FEE = Decimal('20.00') # <-- ADD THIS LINE
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', '50'))
+ADMIN_SUMMARY_TTL_SECONDS = int(os.environ.get('ADMIN_SUMMARY_TTL_SECONDS', '60'))
+CLIENT_PAGE_SIZE = int(os.environ.get('CLIENT_PAGE_SIZE', '20'))
+FIXER_PAGE_SIZE = int(os.environ.get('FIXER_PAGE_SIZE', '20'))
+FIXER_ACTIVE_JOB_STATUSES = ['assigned', 'accepted']
+ADMIN_JOB_STATUSES = ['awaiting_payment', 'paid_unassigned', 'unassigned', 'assigned', 'accepted', 'complete', 'cancelled']
+
+# --- Abandoned conversation handling ---
+CONVERSATION_TTL_HOURS = float(os.environ.get('CONVERSATION_TTL_HOURS', '24'))
+CONVERSATION_NUDGE_MINUTES = float(os.environ.get('CONVERSATION_NUDGE_MINUTES', '30'))
+CONVERSATION_NUDGE_MESSAGE = os.environ.get(
+    'CONVERSATION_NUDGE_MESSAGE',
+    "Are you still there? Reply to carry on with your FixMate-SA request, or say 'hello' to start over."
+)
+
+# --- Offline reverse geocoding ---
+AREA_INDEX_PATH = os.environ.get('AREA_INDEX_PATH')
+if AREA_INDEX_PATH:
+    load_area_index(AREA_INDEX_PATH)
 
 # --- Initialize Extensions ---
-from app.models import db, User, Fixer, Job, DataInsight
-from app.services import send_whatsapp_message
-db.init_app(app)
-migrate = Migrate(app, db)
-login_manager = LoginManager()
-login_manager.init_app(app)
-
-# --- NEW: Import and register the API blueprint ---
-from app.api_routes import api as api_blueprint, init_api_serializer
-app.register_blueprint(api_blueprint, url_prefix='/api')
-# Initialize the serializer in the API routes file with our app's secret key
-init_api_serializer(app.config['SECRET_KEY'])
-
-@login_manager.user_loader
-def load_user(user_id):
-    if session.get('user_type') == 'fixer': return db.session.get(Fixer, int(user_id))
-    return db.session.get(User, int(user_id))
+# The database, login manager and /api blueprint are set up by create_app (app/__init__.py).
+from app.models import db, User, Fixer, Job, JobHistory, DataInsight, PaymentNotification
+from app.api_routes import api_rate_limited
 serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
 
 # --- MODIFIED: Speech-to-Text & Translation Function for 360dialog ---
@@ -78,6 +95,8 @@ def transcribe_audio(media_id):
         print("ERROR: GEMINI_API_KEY not set. Cannot transcribe/translate.")
         return None
 
+    import requests  # deferred, like the Gemini client: only voice notes need it here
+
     try:
         # Step 1: Download the audio file from 360dialog - FIXED URL
         media_url = f"https://waba-v2.360dialog.io/{media_id}"
@@ -93,15 +112,15 @@ def transcribe_audio(media_id):
         
         # Step 2: Upload to Gemini and Transcribe
         audio_file = io.BytesIO(r.content)
-        gemini_file = genai.upload_file(audio_file, mime_type=content_type)
-        model = genai.GenerativeModel('models/gemini-1.5-flash')
+        gemini_file = gemini().upload_file(audio_file, mime_type=content_type)
+        model = gemini().GenerativeModel('models/gemini-1.5-flash')
         
         transcription_prompt = [
             "Please transcribe the following audio. The user is in South Africa and might be speaking in English, Sepedi, Xitsonga, Tshivenda, or Afrikaans.", 
             gemini_file
         ]
         transcription_response = model.generate_content(transcription_prompt)
-        genai.delete_file(gemini_file.name)
+        gemini().delete_file(gemini_file.name)
         
         if not transcription_response.text:
             print("Transcription failed: No text in response.")
@@ -148,7 +167,7 @@ def generate_platform_insights():
     ]
 
     try:
-        model = genai.GenerativeModel('models/gemini-1.5-flash')
+        model = gemini().GenerativeModel('models/gemini-1.5-flash')
         prompt = f"""
         You are a business analyst for FixMate-SA, a South African service platform.
         Analyze the following list of recent jobs, which are provided as a JSON object.
@@ -184,7 +203,7 @@ def analyze_feedback_sentiment(comment):
         return "Unknown"
     
     try:
-        model = genai.GenerativeModel('models/gemini-1.5-flash')
+        model = gemini().GenerativeModel('models/gemini-1.5-flash')
         prompt = f"""
         Analyze the sentiment of the following customer feedback. 
         Classify it as one of these three categories: 'Positive', 'Negative', or 'Neutral'.
@@ -212,31 +231,10 @@ def analyze_feedback_sentiment(comment):
 def get_area_from_coords(lat, lon):
     """
     Performs a reverse geocoding lookup to get a suburb/city from coordinates.
-    Uses the free OpenStreetMap Nominatim API.
+    Answers from the offline area index when the point is covered and falls
+    back to the free OpenStreetMap Nominatim API otherwise.
     """
-    try:
-        url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lon}"
-        # Nominatim requires a descriptive User-Agent header
-        headers = {'User-Agent': 'FixMate-SA/1.0'}
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        address = data.get('address', {})
-        
-        # Try to get the most specific location available
-        area = address.get('suburb') or address.get('city_district') or address.get('city') or address.get('town')
-        
-        if area:
-            print(f"Reverse geocoding successful: Found area '{area}'")
-            return area
-        else:
-            print("Reverse geocoding could not determine a specific area.")
-            return "Unknown Area"
-            
-    except requests.exceptions.RequestException as e:
-        print(f"Error during reverse geocoding API call: {e}")
-        return "Unknown Area" # Fallback in case of API error
+    return resolve_area(lat, lon)
 
 def generate_and_act_on_insight():
     if not GEMINI_API_KEY:
@@ -246,7 +244,7 @@ def generate_and_act_on_insight():
         return "Not enough job data to analyze."
     job_data = [{'description': job.description, 'area': job.area} for job in completed_jobs]
     try:
-        model = genai.GenerativeModel('models/gemini-1.5-flash')
+        model = gemini().GenerativeModel('models/gemini-1.5-flash')
         prompt = f"""
         You are a business analyst for FixMate-SA. Analyze the following list of jobs.
         Identify a single high-demand skill in a specific area.
@@ -290,7 +288,7 @@ def analyze_feedback_sentiment(comment):
         print("WARN: GEMINI_API_KEY not set. Cannot analyze sentiment.")
         return "Unknown"
     try:
-        model = genai.GenerativeModel('models/gemini-1.5-flash')
+        model = gemini().GenerativeModel('models/gemini-1.5-flash')
         prompt = f"""
         Analyze the sentiment of the following customer feedback.
         Classify it as one of these three categories: 'Positive', 'Negative', or 'Neutral'.
@@ -315,7 +313,7 @@ def classify_service_request(service_description):
         if any(k in desc for k in ['light', 'electr', 'plug', 'wiring', 'switch']): return 'electrical'
         return 'general'
     try:
-        model = genai.GenerativeModel('models/gemini-1.5-flash')
+        model = gemini().GenerativeModel('models/gemini-1.5-flash')
         prompt = f"""
         Analyze the following home repair request from a South African user.
         Classify it into one of these three categories: 'plumbing', 'electrical', or 'general'.
@@ -333,31 +331,15 @@ def classify_service_request(service_description):
         return 'general'
 
 def get_or_create_user(phone_number):
+    """
+    Ensures the phone number is in WhatsApp format, then retrieves the existing
+    user or creates a new one. New users are only flushed; the caller commits.
+    """
     if not phone_number.startswith("whatsapp:"): phone_number = f"whatsapp:{phone_number}"
     user = User.query.filter_by(phone_number=phone_number).first()
-    if not user: user = User(phone_number=phone_number); db.session.add(user); db.session.commit()
+    if not user: user = User(phone_number=phone_number); db.session.add(user); db.session.flush()
     return user
 
-def set_user_state(user, new_state, data=None):
-    cached_data = json.loads(user.service_request_cache) if user.service_request_cache else {}
-    if data:
-        cached_data.update(data)
-    user.conversation_state = new_state
-    user.service_request_cache = json.dumps(cached_data)
-    db.session.commit()
-    print(f"State for {user.phone_number} set to {new_state} with data: {cached_data}")
-
-def get_user_cache(user):
-    if user.service_request_cache:
-        return json.loads(user.service_request_cache)
-    return {}
-
-def clear_user_state(user):
-    user.conversation_state = None
-    user.service_request_cache = None
-    db.session.commit()
-    print(f"State for {user.phone_number} cleared.")
-
 def find_fixer_for_job(job):
     skill_needed = classify_service_request(job.description)
     eligible_fixers = Fixer.query.filter(
@@ -374,6 +356,13 @@ def find_fixer_for_job(job):
         if not eligible_fixers:
             print("No eligible fixers found for this job.")
             return None
+    from geopy.distance import geodesic  # deferred: geopy is only needed once a job is being matched
+    # Every candidate's average rating in one grouped query, rather than one AVG per fixer.
+    average_ratings = dict(db.session.execute(
+        db.select(JobHistory.fixer_id, db.func.avg(JobHistory.rating))
+        .where(JobHistory.fixer_id.in_([fixer.id for fixer in eligible_fixers]), JobHistory.rating != None)
+        .group_by(JobHistory.fixer_id)
+    ).all())
     scored_fixers = []
     for fixer in eligible_fixers:
         score = 0
@@ -383,7 +372,7 @@ def find_fixer_for_job(job):
             distance_km = geodesic(client_location, fixer_location).km
             proximity_score = max(0, 50 - (distance_km * 2))
             score += proximity_score
-        avg_rating = db.session.query(db.func.avg(Job.rating)).filter(Job.fixer_id==fixer.id, Job.rating != None).scalar() or 3.5
+        avg_rating = float(average_ratings.get(fixer.id) or 3.5)
         score += (avg_rating / 5) * 30
         if fixer.last_assigned_at:
             hours_since_last_job = (datetime.now(timezone.utc) - fixer.last_assigned_at).total_seconds() / 3600
@@ -396,18 +385,33 @@ def find_fixer_for_job(job):
         return None
     best_fixer_data = max(scored_fixers, key=lambda x: x['score'])
     best_fixer = best_fixer_data['fixer']
-    best_fixer.last_assigned_at = datetime.now(timezone.utc)
-    db.session.commit()
+    best_fixer.last_assigned_at = datetime.now(timezone.utc)  # Committed by the caller with the job
     print(f"Best match found: {best_fixer.full_name} with score {best_fixer_data['score']:.2f}")
     return best_fixer
 
+def keyset_page(query, key_column, before=None, page_size=None):
+    """
+    Returns one page of `query` ordered by `key_column` descending, starting
+    below the `before` cursor, plus the cursor for the next page (or None).
+    Unlike OFFSET, every page costs the same no matter how deep it is.
+    """
+    page_size = page_size or ADMIN_PAGE_SIZE
+    if before:
+        query = query.filter(key_column < before)
+    rows = query.order_by(key_column.desc()).limit(page_size + 1).all()
+    next_cursor = getattr(rows[page_size - 1], key_column.key) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
 def create_new_job_in_db(user, job_data):
     job = Job(
         description=job_data.get('service'),
         latitude=job_data.get('latitude'),
         longitude=job_data.get('longitude'),
         client_contact_number=job_data.get('contact'),
-        client_id=user.id
+        client_id=user.id,
+        # Only the offline index is consulted here so the webhook never waits on Nominatim;
+        # jobs outside its coverage are picked up by `flask backfill-job-areas`.
+        area=resolve_area(job_data.get('latitude'), job_data.get('longitude'), allow_remote=False)
     )
     matched_fixer = find_fixer_for_job(job)
     if matched_fixer:
@@ -418,7 +422,7 @@ def create_new_job_in_db(user, job_data):
     else:
         job.status = 'unassigned'
     db.session.add(job)
-    db.session.commit()
+    db.session.flush()  # Assigns job.id; the caller commits
     return job.id, matched_fixer is not None
 
 # --- Admin Commands & Web Routes ---
@@ -472,7 +476,8 @@ def demote_admin(phone):
 
 @app.cli.command("remove-fixer")
 @click.argument("phone")
-def remove_fixer(phone):
+@click.option('--dry-run', is_flag=True, help='Only report what would be deleted.')
+def remove_fixer(phone, dry_run):
     if phone.startswith('0') and len(phone) == 10: formatted_phone = f"+27{phone[1:]}"
     elif phone.startswith('+') and len(phone) == 12: formatted_phone = phone
     else:
@@ -482,10 +487,17 @@ def remove_fixer(phone):
     if not fixer:
         print(f"Error: Fixer with phone number {whatsapp_phone} not found.")
         return
-    if click.confirm(f"Are you sure you want to delete fixer '{fixer.full_name}' ({fixer.phone_number})? This cannot be undone.", abort=True):
-        db.session.delete(fixer)
-        db.session.commit()
-        print(f"Successfully deleted fixer: {fixer.full_name}")
+    fixer_name = fixer.full_name
+    if count_fixers_with_ledger_history(Fixer.id == fixer.id):
+        print(f"Error: Fixer '{fixer_name}' has entries in the balance ledger, which must be kept. "
+              f"Deactivate them instead with `flask toggle-fixer-active {phone}`.")
+        return
+    _, job_count = count_fixers(Fixer.id == fixer.id)
+    if dry_run:
+        print(f"Dry run: would delete fixer '{fixer_name}' and unassign {job_count} job(s)."); return
+    if click.confirm(f"Are you sure you want to delete fixer '{fixer_name}' ({fixer.phone_number})? {job_count} job(s) will be unassigned. This cannot be undone.", abort=True):
+        delete_fixers(Fixer.id == fixer.id)
+        print(f"Successfully deleted fixer: {fixer_name}")
 
 @app.route('/admin/delete_fixer', methods=['POST'])
 @login_required
@@ -495,11 +507,14 @@ def admin_delete_fixer():
         return redirect(url_for('login'))
 
     fixer_id = request.form.get('fixer_id')
-    fixer = db.session.get(Fixer, int(fixer_id))
-    if fixer:
-        db.session.delete(fixer)
-        db.session.commit()
-        flash(f"Fixer '{fixer.full_name}' has been deleted.", 'success')
+    fixer = db.session.get(Fixer, int(fixer_id)) if fixer_id and fixer_id.isdigit() else None
+    if fixer and count_fixers_with_ledger_history(Fixer.id == fixer.id):
+        flash(f"Fixer '{fixer.full_name}' has balance history in the ledger and can't be deleted. Deactivate them instead.", 'danger')
+    elif fixer:
+        fixer_name = fixer.full_name
+        delete_fixers(Fixer.id == fixer.id)
+        invalidate_platform_summary()
+        flash(f"Fixer '{fixer_name}' has been deleted.", 'success')
     else:
         flash("Fixer not found.", 'warning')
 
@@ -507,7 +522,8 @@ def admin_delete_fixer():
 
 @app.cli.command("remove-client")
 @click.argument("phone")
-def remove_client(phone):
+@click.option('--dry-run', is_flag=True, help='Only report what would be deleted.')
+def remove_client(phone, dry_run):
     if phone.startswith('0') and len(phone) == 10: formatted_phone = f"+27{phone[1:]}"
     elif phone.startswith('+') and len(phone) == 12: formatted_phone = phone
     else:
@@ -517,10 +533,13 @@ def remove_client(phone):
     if not user:
         print(f"Error: Client with phone number {whatsapp_phone} not found.")
         return
-    if click.confirm(f"Are you sure you want to delete client '{user.full_name or user.phone_number}'? This cannot be undone.", abort=True):
-        db.session.delete(user)
-        db.session.commit()
-        print(f"Successfully deleted client: {user.full_name or user.phone_number}")
+    client_name = user.full_name or user.phone_number
+    _, job_count = count_clients(User.id == user.id)
+    if dry_run:
+        print(f"Dry run: would delete client '{client_name}' and {job_count} job(s)."); return
+    if click.confirm(f"Are you sure you want to delete client '{client_name}' and their {job_count} job(s)? This cannot be undone.", abort=True):
+        delete_clients(User.id == user.id)
+        print(f"Successfully deleted client: {client_name}")
 
 @app.cli.command("analyze-data")
 def analyze_data():
@@ -529,12 +548,20 @@ def analyze_data():
     print(f"Insight & Action: {insight}")
 
 @app.cli.command("stats")
+@read_only
 def stats():
-    user_count = User.query.count()
-    fixer_count = Fixer.query.count()
+    summary = platform_summary()
     print("--- FixMate-SA System Statistics ---")
-    print(f"Total Registered Clients: {user_count}")
-    print(f"Total Registered Fixers:  {fixer_count}")
+    print(f"Total Registered Clients: {summary['user_count']}")
+    print(f"Total Registered Fixers:  {summary['fixer_count']}")
+    print(f"Total Jobs Logged:        {summary['job_count']}")
+    for status, count in summary['jobs_by_status'].items():
+        print(f"  {status:<22}{count}")
+    average_rating = f"{summary['average_rating']:.2f}/5" if summary['average_rating'] is not None else "N/A"
+    print(f"Average Rating:           {average_rating} ({summary['rated_jobs']} rated)")
+    for sentiment, count in summary['sentiment_counts'].items():
+        print(f"  {sentiment:<22}{count}")
+    print(f"Job Fee Revenue:          R{summary['fee_revenue']:.2f}")
     print("------------------------------------")
 
 @app.cli.command("list-admins")
@@ -565,22 +592,69 @@ def toggle_fixer_active(phone):
     status = "ACTIVE" if fixer.is_active else "INACTIVE"
     print(f"Successfully set fixer '{fixer.full_name}' to {status}.")
 
+LIST_JOBS_FIELDS = ['id', 'status', 'created_at', 'client', 'fixer', 'area', 'description']
+
+def _list_jobs_row(job):
+    return {
+        'id': job.id,
+        'status': job.status,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'client': job.client.full_name or job.client.phone_number,
+        'fixer': job.assigned_fixer.full_name if job.assigned_fixer else None,
+        'area': job.area,
+        'description': job.description,
+    }
+
 @app.cli.command("list-jobs")
 @click.option('--status', default=None, help='Filter jobs by status (e.g., paid_unassigned, awaiting_payment).')
-def list_jobs(status):
-    query = Job.query
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S']), default=None, help='Only jobs created on or after this date.')
+@click.option('--limit', type=int, default=None, help='Stop after this many jobs.')
+@click.option('--format', 'output_format', type=click.Choice(['text', 'csv', 'jsonl']), default='text', help='Output format.')
+@click.option('--batch-size', default=500, show_default=True, help='Rows fetched from the database per round trip.')
+@read_only
+def list_jobs(status, since, limit, output_format, batch_size):
+    """Lists jobs newest first, streaming rows so large tables can be piped elsewhere."""
+    # Client and fixer are joined into the same query, and rows are fetched in
+    # batches (a server-side cursor on PostgreSQL) instead of all at once.
+    query = Job.query.options(joinedload(Job.client), joinedload(Job.assigned_fixer))
     if status:
         query = query.filter_by(status=status)
-    jobs = query.order_by(Job.id.desc()).all()
-    if not jobs:
-        print(f"No jobs found" + (f" with status '{status}'." if status else "."))
-        return
-    print(f"--- Jobs" + (f" with status: {status}" if status else "") + " ---")
-    for job in jobs:
-        client_name = job.client.full_name or job.client.phone_number
-        fixer_name = job.assigned_fixer.full_name if job.assigned_fixer else "N/A"
-        print(f"ID: {job.id} | Status: {job.status} | Client: {client_name} | Fixer: {fixer_name} | Desc: {job.description[:30]}...")
-    print("--------------------")
+    if since:
+        query = query.filter(Job.created_at >= since)
+    query = query.order_by(Job.id.desc())
+    if limit:
+        query = query.limit(limit)
+
+    out = sys.stdout
+    writer = None
+    count = 0
+    try:
+        for job in query.yield_per(batch_size):
+            row = _list_jobs_row(job)
+            if output_format == 'csv':
+                if writer is None:
+                    writer = csv.DictWriter(out, fieldnames=LIST_JOBS_FIELDS)
+                    writer.writeheader()
+                writer.writerow(row)
+            elif output_format == 'jsonl':
+                out.write(json.dumps(row) + "\n")
+            else:
+                if count == 0:
+                    print(f"--- Jobs" + (f" with status: {status}" if status else "") + " ---")
+                print(f"ID: {job.id} | Status: {job.status} | Client: {row['client']} | Fixer: {row['fixer'] or 'N/A'} | Desc: {job.description[:30]}...")
+            count += 1
+            if count % batch_size == 0:
+                out.flush()
+        if output_format == 'text':
+            if count == 0:
+                print(f"No jobs found" + (f" with status '{status}'." if status else "."))
+            else:
+                print("--------------------")
+        out.flush()
+    except BrokenPipeError:
+        # The reader (e.g. `head`) went away; stop quietly instead of printing a traceback.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, out.fileno())
 
 @app.cli.command("reassign-job")
 @click.argument("job_id", type=int)
@@ -610,32 +684,303 @@ def reassign_job(job_id, fixer_phone):
     send_whatsapp_message(to_number=new_fixer.phone_number, message_body=f"Job Reassigned to You:\n\nService: {job.description}\nClient Contact: {job.client_contact_number}\n\nPlease go to your Fixer Portal to accept this job.")
 
 @app.cli.command("remove-all-clients")
-def remove_all_clients():
+@click.option('--dry-run', is_flag=True, help='Only report how many clients and jobs would be deleted.')
+@click.option('--chunk-size', default=1000, type=int, help='Clients deleted per transaction.')
+def remove_all_clients(dry_run, chunk_size):
     """Deletes all non-admin clients and their associated jobs."""
-    clients_to_delete = User.query.filter_by(is_admin=False).all()
-    
-    if not clients_to_delete:
+    client_count, job_count = count_clients(User.is_admin == False)  # noqa: E712
+
+    if not client_count:
         print("There are no non-admin clients to remove.")
         return
+    if dry_run:
+        print(f"Dry run: would delete {client_count} client(s) and {job_count} job(s).")
+        return
 
-    client_count = len(clients_to_delete)
-    
     # Confirmation prompt to prevent accidental deletion
     if click.confirm(
         f"Are you sure you want to delete {client_count} client(s)? "
-        "This will also delete all of their associated jobs and cannot be undone.", 
+        f"This will also delete {job_count} associated job(s) and cannot be undone.",
         abort=True
     ):
-        for client in clients_to_delete:
-            db.session.delete(client)
-        
-        db.session.commit()
-        print(f"Successfully deleted {client_count} client(s).")
+        deleted = delete_clients(
+            User.is_admin == False,  # noqa: E712
+            chunk_size=chunk_size,
+            progress=lambda done: print(f"  deleted {done}/{client_count} client(s)", end='\r'),
+        )
+        print()
+        print(f"Successfully deleted {deleted} client(s).")
+
+@app.cli.command("fixer-topup")
+@click.argument("phone")
+@click.argument("amount", type=click.FloatRange(min=0, min_open=True))
+@click.option('--note', default=None, help='Reference shown in the ledger (e.g. the bank deposit reference).')
+def fixer_topup(phone, amount, note):
+    """Credits a fixer's balance and records it in the ledger."""
+    if phone.startswith('0') and len(phone) == 10: formatted_phone = f"+27{phone[1:]}"
+    elif phone.startswith('+') and len(phone) == 12: formatted_phone = phone
+    else:
+        print("Error: Invalid phone number format. Use a 10-digit or international format."); return
+    fixer = Fixer.query.filter_by(phone_number=f"whatsapp:{formatted_phone}").first()
+    if not fixer:
+        print(f"Error: Fixer with phone number whatsapp:{formatted_phone} not found."); return
+    record_entry(fixer.id, 'topup', Decimal(str(amount)).quantize(Decimal('0.01')), note=note)
+    db.session.commit()
+    db.session.refresh(fixer)
+    print(f"Topped up '{fixer.full_name}'. New balance: R{fixer.balance:.2f}")
+
+@app.cli.command("ledger-snapshot")
+def ledger_snapshot():
+    """Records each fixer's ledger balance so reconciliation only reads newer entries."""
+    written = take_snapshots()
+    print(f"Wrote {written} balance snapshot(s).")
+
+@app.cli.command("ledger-reconcile")
+@read_only
+def ledger_reconcile():
+    """Compares every fixer's stored balance with their ledger balance."""
+    mismatches = reconcile()
+    if not mismatches:
+        print("All fixer balances match the ledger.")
+        return
+    print("--- Balance mismatches ---")
+    for fixer_id, stored, ledger in mismatches:
+        print(f"Fixer #{fixer_id}: stored R{stored:.2f}, ledger R{ledger:.2f} (difference R{stored - ledger:.2f})")
+    print("--------------------------")
+
+@app.cli.command("payout-export")
+@click.argument("output", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--min-amount', default=50.0, type=click.FloatRange(min=0, min_open=True), show_default=True, help='Smallest balance worth paying out.')
+@click.option('--chunk-size', default=500, type=int, help='Fixers settled per transaction.')
+@click.option('--reference', default=None, help='Batch reference for the bank file and ledger (default: PAYOUT-<UTC timestamp>).')
+@click.option('--dry-run', is_flag=True, help='Write the CSV without recording the payouts in the ledger.')
+@click.option('--rebuild', is_flag=True, help='Rewrite the CSV for the already settled batch --reference from the ledger.')
+def payout_export(output, min_amount, chunk_size, reference, dry_run, rebuild):
+    """Writes a bank bulk-payment CSV for fixer balances and settles their ledger entries."""
+    if rebuild:
+        if not reference:
+            raise click.UsageError("--rebuild needs the --reference of the batch to rewrite.")
+        with click.open_file(output, 'w') as out:
+            paid, total = rebuild_payout_file(out, reference)
+        print(f"{paid} payout(s) totalling R{total:.2f} rewritten for reference {reference}.", file=sys.stderr)
+        return
+    if reference and reference_used(reference):
+        raise click.UsageError(f"Reference {reference} has already been paid out. Use --rebuild to rewrite its CSV.")
+    reference = reference or f"PAYOUT-{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+    min_amount = Decimal(str(min_amount)).quantize(Decimal('0.01'))
+    try:
+        with click.open_file(output, 'w') as out:
+            paid, total = export_payouts(
+                out, reference, min_amount=min_amount, chunk_size=chunk_size, settle=not dry_run,
+                progress=lambda done, amount: print(f"  {done} payout(s), R{amount:.2f}", end='\r', file=sys.stderr),
+            )
+    except Exception:
+        if not dry_run:
+            print(f"\nWARN: The export stopped part-way. Payouts already settled are in the ledger under {reference}; "
+                  f"rewrite their CSV with `flask payout-export --rebuild --reference {reference} FILE`.", file=sys.stderr)
+        raise
+    print(file=sys.stderr)
+    action = "would be paid" if dry_run else "settled"
+    print(f"{paid} payout(s) totalling R{total:.2f} {action} under reference {reference}.", file=sys.stderr)
+
+@app.cli.command("process-payments")
+def process_payments():
+    """Processes stored PayFast ITNs that were not handled (e.g. the worker restarted mid-task)."""
+    pending = db.session.scalars(
+        db.select(PaymentNotification.id).where(PaymentNotification.status == 'received').order_by(PaymentNotification.id)
+    ).all()
+    for notification_id in pending:
+        process_payment_notification(notification_id, fixer_portal_url())
+    print(f"Processed {len(pending)} pending payment notification(s).")
+
+@app.cli.command("payment-link")
+@click.argument("job_id", type=int)
+@click.argument("amount", type=click.FloatRange(min=0, min_open=True))
+def payment_link_command(job_id, amount):
+    """Sets a job's amount and prints its PayFast payment link (links use PUBLIC_BASE_URL)."""
+    job = db.session.get(Job, job_id)
+    if not job:
+        print(f"Error: Job #{job_id} not found."); return
+    with app.test_request_context(base_url=os.environ.get('PUBLIC_BASE_URL', 'http://localhost:5000')):
+        link = payment_link(job, amount)
+    db.session.commit()
+    print(link)
+
+@app.cli.command("simulate-itn")
+@click.argument("job_id", type=int)
+@click.argument("amount", type=float, required=False)
+@click.option('--status', 'payment_status', default='COMPLETE', help='PayFast payment_status to send.')
+@click.option('--pf-payment-id', default=None, help='Reuse an ID to test duplicate deliveries.')
+def simulate_itn(job_id, amount, payment_status, pf_payment_id):
+    """Local PayFast stand-in: posts a correctly signed ITN to /payment/notify (needs PAYFAST_PASSPHRASE and PAYFAST_MERCHANT_ID)."""
+    if amount is None:
+        job = db.session.get(Job, job_id)
+        amount = job.amount if job and job.amount is not None else 0
+    fields = payfast.build_itn(job_id, amount, passphrase=PAYFAST_PASSPHRASE,
+                               merchant_id=PAYFAST_MERCHANT_ID,
+                               pf_payment_id=pf_payment_id, payment_status=payment_status)
+    response = app.test_client().post('/payment/notify', data=urlencode(fields),
+                                      content_type='application/x-www-form-urlencoded')
+    print(f"POST /payment/notify -> {response.status_code} (pf_payment_id={dict(fields)['pf_payment_id']})")
+
+@app.cli.command("archive-jobs")
+@click.option('--older-than-days', default=180, type=int, show_default=True, help='Archive complete and cancelled jobs created before this many days ago.')
+@click.option('--batch-size', default=1000, type=int, help='Jobs moved per transaction.')
+@click.option('--dry-run', is_flag=True, help='Only report how many jobs would be archived.')
+def archive_jobs_command(older_than_days, batch_size, dry_run):
+    """Moves old finished jobs from `jobs` into `jobs_archive`."""
+    candidates = count_archivable(older_than_days)
+    if dry_run or not candidates:
+        print(f"{candidates} job(s) older than {older_than_days} day(s) can be archived.")
+        return
+    archived = archive_jobs(
+        older_than_days, batch_size=batch_size,
+        progress=lambda done: print(f"  archived {done}/{candidates} job(s)", end='\r'),
+    )
+    print()
+    print(f"Archived {archived} job(s). Client and fixer history still include them.")
+
+@app.cli.command("build-area-index")
+@click.argument("geojson_path", type=click.Path(exists=True, dir_okay=False))
+@click.argument("output_path", type=click.Path(dir_okay=False))
+@click.option('--name-property', default='name', help='GeoJSON feature property holding the area name.')
+@click.option('--point-radius-km', default=3.0, type=float, help='Coverage radius for point (centroid) features.')
+def build_area_index_command(geojson_path, output_path, name_property, point_radius_km):
+    """Builds the offline area index file from a GeoJSON suburb extract."""
+    try:
+        count = build_area_index(geojson_path, output_path, name_property=name_property, point_radius_km=point_radius_km)
+    except ValueError as e:
+        print(f"Error: {e}"); return
+    print(f"Successfully built area index with {count} areas at {output_path}")
+    print(f"Set AREA_INDEX_PATH={output_path} to use it for reverse geocoding.")
+
+def _read_backfill_checkpoint(path):
+    try:
+        with open(path, 'r') as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def _write_backfill_checkpoint(path, last_id):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(str(last_id))
+    os.replace(tmp_path, path)
+
+@app.cli.command("backfill-job-areas")
+@click.option('--chunk-size', default=500, type=int, help='Jobs fetched and updated per batch.')
+@click.option('--concurrency', default=4, type=int, help='Maximum geocoding lookups in flight.')
+@click.option('--max-rps', default=None, type=float, help='Override the Nominatim requests-per-second limit.')
+@click.option('--checkpoint', default='.job_area_backfill', type=click.Path(dir_okay=False), help='File recording the last processed job ID.')
+@click.option('--restart', is_flag=True, help='Ignore any existing checkpoint and start from the first job.')
+def backfill_job_areas(chunk_size, concurrency, max_rps, checkpoint, restart):
+    """Fills in Job.area for jobs that have coordinates but no area."""
+    if max_rps is not None:
+        nominatim_throttle.set_rate(max_rps)
+    last_id = 0 if restart else _read_backfill_checkpoint(checkpoint)
+    if last_id:
+        print(f"Resuming from checkpoint: jobs after ID {last_id}.")
+
+    resolved_total = skipped_total = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        while True:
+            # Keyset pagination: each batch starts after the last ID seen, so it stays cheap on a large table.
+            rows = db.session.execute(
+                db.select(Job.id, Job.latitude, Job.longitude)
+                .where(Job.id > last_id,
+                       Job.area.is_(None),
+                       Job.latitude.isnot(None),
+                       Job.longitude.isnot(None))
+                .order_by(Job.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+
+            # Jobs from the same pin are only geocoded once per batch.
+            coords = list({(row.latitude, row.longitude) for row in rows})
+            areas = dict(zip(coords, pool.map(
+                lambda c: resolve_area(c[0], c[1], error_value=None), coords)))
+
+            updates = [{'id': row.id, 'area': areas[(row.latitude, row.longitude)]}
+                       for row in rows if areas[(row.latitude, row.longitude)]]
+            if updates:
+                db.session.execute(db.update(Job), updates)
+            db.session.commit()
+
+            last_id = rows[-1].id
+            _write_backfill_checkpoint(checkpoint, last_id)
+            resolved_total += len(updates)
+            skipped_total += len(rows) - len(updates)
+            print(f"Processed up to job #{last_id}: {resolved_total} resolved, {skipped_total} left for a later run.")
+
+    print(f"Backfill complete. {resolved_total} job(s) updated, {skipped_total} could not be resolved (re-run with --restart to retry them).")
+
+@app.cli.command("sweep-conversations")
+@click.option('--expire-after-hours', default=CONVERSATION_TTL_HOURS, type=float, show_default=True, help='Reset conversations idle for longer than this.')
+@click.option('--nudge-after-minutes', default=CONVERSATION_NUDGE_MINUTES, type=float, show_default=True, help="Send a 'still there?' message after this much idle time (0 disables).")
+@click.option('--batch-size', default=500, type=int, help='Users nudged per batch.')
+def sweep_conversations(expire_after_hours, nudge_after_minutes, batch_size):
+    """Nudges idle conversations and resets abandoned ones. Meant to run periodically (e.g. every 5 minutes)."""
+    now = datetime.now(timezone.utc)
+    expire_cutoff = now - timedelta(hours=expire_after_hours)
+
+    # 1. Reset every abandoned conversation in one indexed UPDATE, without loading any users.
+    expired = db.session.execute(
+        db.update(User)
+        .where(User.conversation_state.isnot(None),
+               User.conversation_updated_at < expire_cutoff)
+        .values(conversation_state=None,
+                service_request_cache=None,
+                conversation_updated_at=None,
+                conversation_nudged_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    print(f"Reset {expired} abandoned conversation(s) idle for more than {expire_after_hours:g} hour(s).")
+
+    # 2. Nudge users who have gone quiet but can still pick up where they left off.
+    # Each batch is stamped and committed before anything is sent, so a crash
+    # mid-batch can't nudge the same users twice. The UPDATE re-checks the idle
+    # conditions itself: anyone who replied since the batch was picked is skipped.
+    nudged = 0
+    if nudge_after_minutes > 0:
+        nudge_cutoff = now - timedelta(minutes=nudge_after_minutes)
+        is_idle = (User.conversation_state.isnot(None),
+                   User.conversation_updated_at < nudge_cutoff,
+                   User.conversation_nudged_at.is_(None))
+        while True:
+            batch = (db.select(User.id).where(*is_idle)
+                     .order_by(User.conversation_updated_at)
+                     .limit(batch_size))
+            idle_users = db.session.execute(
+                db.update(User)
+                .where(User.id.in_(batch.scalar_subquery()), *is_idle)
+                .values(conversation_nudged_at=now)
+                .returning(User.id, User.phone_number)
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.session.commit()
+            if not idle_users:
+                break
+            for idle_user in idle_users:
+                send_whatsapp_message(to_number=idle_user.phone_number, message_body=CONVERSATION_NUDGE_MESSAGE)
+            nudged += len(idle_users)
+        print(f"Sent {nudged} 'still there?' nudge(s).")
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/metrics')
+def metrics_endpoint():
+    # Scrapers must send METRICS_TOKEN as a bearer token; without one configured the endpoint doesn't exist.
+    if not METRICS_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(metrics.snapshot())
+
 @app.route('/terms')
 def terms():
     return render_template('terms.html')
@@ -645,6 +990,7 @@ def privacy_policy():
     return render_template('privacy.html')
 
 @app.route('/api/update_location', methods=['POST'])
+@api_rate_limited
 @login_required
 def update_location():
     if session.get('user_type') != 'fixer':
@@ -660,6 +1006,7 @@ def update_location():
     return jsonify({'status': 'success'}), 200
 
 @app.route('/api/fixer_location/<int:job_id>')
+@api_rate_limited
 @login_required
 def get_fixer_location(job_id):
     job = Job.query.filter_by(id=job_id, client_id=current_user.id).first_or_404()
@@ -709,6 +1056,7 @@ def login():
             flash('Please enter a valid 10-digit South African cell number.', 'danger'); return redirect(url_for('login'))
         formatted_number_db = f"whatsapp:+27{phone_number[1:]}"
         user = get_or_create_user(formatted_number_db)
+        db.session.commit()
         token = serializer.dumps({'id': user.id, 'type': 'user'}, salt='login-salt')
         login_url = url_for('authenticate', token=token, _external=True)
         send_whatsapp_message(to_number=formatted_number_db, message_body=f"Hi! To log in to your FixMate-SA dashboard, please click this link:\n\n{login_url}")
@@ -754,30 +1102,100 @@ def logout(): logout_user(); flash('You have been logged out.', 'info'); return
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    jobs = Job.query.filter_by(client_id=current_user.id).order_by(Job.id.desc()).all()
-    return render_template('dashboard.html', jobs=jobs)
+    # Live and archived jobs together, newest first, one page at a time.
+    jobs, next_jobs_cursor = keyset_page(
+        JobHistory.query.options(joinedload(JobHistory.assigned_fixer)).filter(JobHistory.client_id == current_user.id),
+        JobHistory.id, request.args.get('jobs_before', type=int), page_size=CLIENT_PAGE_SIZE)
+    return render_template('dashboard.html', jobs=jobs, next_jobs_cursor=next_jobs_cursor)
+
+# --- NEW: Insights only change when `flask generate-insights` runs, so each worker reuses the latest one for a while ---
+_insight_cache = TTLCache(maxsize=1, ttl_seconds=int(os.environ.get('INSIGHT_CACHE_TTL_SECONDS', '300')))
+
+def get_latest_insight():
+    """Returns the newest DataInsight as a plain dict (or None), cached per process."""
+    def load():
+        insight = DataInsight.query.order_by(DataInsight.id.desc()).first()
+        return {'insight_text': insight.insight_text} if insight else None
+    return _insight_cache.get_or_set('latest', load)
 
 @app.route('/fixer/dashboard')
 @login_required
 def fixer_dashboard():
     if session.get('user_type') != 'fixer': flash('Access denied.', 'danger'); return redirect(url_for('login'))
-    latest_insight = DataInsight.query.order_by(DataInsight.id.desc()).first()
-    return render_template('fixer_dashboard.html', latest_insight=latest_insight)
+    fixer_jobs = Job.query.options(joinedload(Job.client)).filter(Job.fixer_id == current_user.id)
+    # Active jobs come first and are few, so all of them are shown (a fixer must never lose sight of
+    # one); ix_jobs_fixer_id_status finds them without touching history.
+    active_jobs = (fixer_jobs.filter(Job.status.in_(FIXER_ACTIVE_JOB_STATUSES))
+                   .order_by(Job.id.desc()).all())
+    # Everything else is history, including archived jobs, one keyset page at a time via the (fixer_id, id) indexes.
+    history_jobs, next_history_cursor = keyset_page(
+        JobHistory.query.options(joinedload(JobHistory.client))
+        .filter(JobHistory.fixer_id == current_user.id, JobHistory.status.notin_(FIXER_ACTIVE_JOB_STATUSES)),
+        JobHistory.id, request.args.get('history_before', type=int), page_size=FIXER_PAGE_SIZE)
+    return render_template('fixer_dashboard.html', latest_insight=get_latest_insight(),
+                           active_jobs=active_jobs, history_jobs=history_jobs,
+                           next_history_cursor=next_history_cursor)
 
 @app.route('/admin')
 @login_required
+@read_only
 def admin_dashboard():
     if not getattr(current_user, 'is_admin', False):
         flash('You do not have permission to access this page.', 'danger'); return redirect(url_for('dashboard'))
-    all_users = User.query.order_by(User.id.desc()).all()
-    all_fixers = Fixer.query.order_by(Fixer.id.desc()).all()
-    all_jobs = Job.query.order_by(Job.id.desc()).all()
-    all_insights = DataInsight.query.order_by(DataInsight.id.desc()).all()
+    status_filter = request.args.get('status') or None
+    if status_filter not in ADMIN_JOB_STATUSES:
+        status_filter = None
+
+    # Jobs: newest first, one page at a time, with client and fixer loaded in the same query.
+    jobs_query = Job.query.options(joinedload(Job.client), joinedload(Job.assigned_fixer))
+    if status_filter:
+        jobs_query = jobs_query.filter(Job.status == status_filter)
+    jobs, next_jobs_cursor = keyset_page(jobs_query, Job.id, request.args.get('jobs_before', type=int))
+
+    fixers, next_fixers_cursor = keyset_page(Fixer.query, Fixer.id, request.args.get('fixers_before', type=int))
+
+    # The assign dropdown only needs id and name, fetched once and rendered once for every job row.
+    approved_fixers = db.session.execute(
+        db.select(Fixer.id, Fixer.full_name)
+        .where(Fixer.vetting_status == 'approved')
+        .order_by(Fixer.full_name)
+    ).all()
+
+    recent_insights = DataInsight.query.order_by(DataInsight.id.desc()).limit(10).all()
     return render_template('admin_dashboard.html',
-                           users=all_users,
-                           fixers=all_fixers,
-                           jobs=all_jobs,
-                           insights=all_insights)
+                           summary=cached_platform_summary(ttl_seconds=ADMIN_SUMMARY_TTL_SECONDS),
+                           fixers=fixers,
+                           jobs=jobs,
+                           approved_fixers=approved_fixers,
+                           insights=recent_insights,
+                           job_statuses=ADMIN_JOB_STATUSES,
+                           status_filter=status_filter,
+                           next_jobs_cursor=next_jobs_cursor,
+                           next_fixers_cursor=next_fixers_cursor)
+
+@app.route('/admin/update_job', methods=['POST'])
+@login_required
+def admin_update_job():
+    if not getattr(current_user, 'is_admin', False): return redirect(url_for('login'))
+    job_id, new_status, fixer_id = request.form.get('job_id'), request.form.get('status'), request.form.get('fixer_id')
+    job = db.session.get(Job, int(job_id)) if job_id and job_id.isdigit() else None
+    if not job or new_status not in ADMIN_JOB_STATUSES:
+        flash('Invalid request.', 'danger'); return redirect(url_for('admin_dashboard'))
+    newly_assigned = None
+    if fixer_id == 'unassign':
+        job.fixer_id = None
+    elif fixer_id and fixer_id.isdigit() and int(fixer_id) != job.fixer_id:
+        newly_assigned = db.session.get(Fixer, int(fixer_id))
+        if not newly_assigned or newly_assigned.vetting_status != 'approved':
+            flash('That fixer cannot be assigned jobs.', 'danger'); return redirect(url_for('admin_dashboard'))
+        job.fixer_id = newly_assigned.id
+    job.status = new_status
+    db.session.commit()
+    invalidate_platform_summary()  # The admin should see their own change straight away.
+    if newly_assigned:
+        send_whatsapp_message(to_number=newly_assigned.phone_number, message_body=f"NEW JOB (Admin Assigned)\n\nService: {job.description}\nClient Contact: {job.client_contact_number}\n\nPlease go to your Fixer Portal to accept this job.")
+    flash(f'Job #{job.id} has been updated.', 'success')
+    return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/assign_job', methods=['POST'])
 @login_required
@@ -832,30 +1250,23 @@ def complete_job(job_id):
         
     job = Job.query.filter_by(id=job_id, fixer_id=current_user.id).first_or_404()
     
-    if job.status == 'accepted':
-        # --- Start of new logic ---
-        
-        # 1. Get the fixer (which is the current_user)
-        fixer = current_user
-        
-        # 2. Deduct the fee from the fixer's balance
-        fixer.balance -= FIXER_JOB_FEE
-        
-        # 3. Update the job status
-        job.status = 'complete'
-        
-        # 4. Commit all changes to the database
+    # 1. Complete the job and deduct the fee in one transaction. Both are
+    #    conditional UPDATEs, so a double click can't charge the fee twice.
+    if job.status == 'accepted' and complete_job_and_charge_fee(job, FIXER_JOB_FEE):
+        # 2. Ask the client for a rating on their next message
+        client_conversation = ConversationSession(job.client)
+        client_conversation.set_state('awaiting_rating', data={'job_id': job.id})
+        client_conversation.flush_state()
+
+        # 3. Commit all changes to the database
         db.session.commit()
-        
-        # --- End of new logic ---
 
         # The rest of the function remains the same
         send_whatsapp_message(
             to_number=job.client.phone_number, 
             message_body=f"Your FixMate job (#{job.id}: '{job.description}') has been marked as complete by {job.assigned_fixer.full_name}.\n\nHow would you rate the service? Please reply with a number from 1 (bad) to 5 (excellent)."
         )
-        set_user_state(job.client, 'awaiting_rating', data={'job_id': job.id})
-        
+
         # Add a more informative flash message
         flash(f'Job #{job.id} marked as complete. A fee of R{FIXER_JOB_FEE:.2f} has been deducted from your balance.', 'success')
     else:
@@ -865,30 +1276,113 @@ def complete_job(job_id):
 
 @app.route('/payment/success')
 def payment_success():
+    # Only PayFast's signed ITN (/payment/notify) marks a job paid; this page just reports progress.
     job_id = request.args.get('job_id')
-    job = db.session.get(Job, int(job_id)) if job_id else None
-    if job and job.payment_status != 'paid':
-        job.payment_status = 'paid'
-        matched_fixer = find_fixer_for_job(job)
-        if matched_fixer:
-            job.assigned_fixer, job.status = matched_fixer, 'assigned'
-            send_whatsapp_message(to_number=matched_fixer.phone_number, message_body=f"New FixMate Job Alert!\n\nService Needed: {job.description}\nClient Contact: {job.client_contact_number}\n\nPlease go to your Fixer Portal to accept this job:\n{url_for('fixer_login', _external=True)}")
-        else:
-            job.status = 'paid_unassigned'
-        db.session.commit()
+    job = db.session.get(Job, int(job_id)) if job_id and job_id.isdigit() else None
+    if job and job.payment_status == 'paid':
         return "<h1>Thank you! Your payment was successful.</h1><p>We are now finding a fixer for you.</p>"
-    return "<h1>Payment Confirmed</h1><p>Your payment may have already been processed.</p>"
+    return "<h1>Thank you!</h1><p>We are confirming your payment with PayFast and will message you on WhatsApp once a fixer has been found.</p>"
 
 @app.route('/payment/cancel')
 def payment_cancel():
-    job_id = request.args.get('job_id')
-    job = db.session.get(Job, int(job_id)) if job_id else None
-    if job: job.status = 'cancelled'; db.session.commit()
+    # PayFast's cancel_url. Only the signed token from payment_link can cancel, and only a job that is unpaid and not yet under way.
+    try:
+        job_id = serializer.loads(request.args.get('token', ''), salt='payment-cancel', max_age=PAYMENT_LINK_MAX_AGE)
+    except BadSignature:
+        job_id = None
+    job = db.session.get(Job, job_id) if isinstance(job_id, int) else None
+    if job and job.payment_status != 'paid' and job.status not in ('accepted', 'complete', 'cancelled'):
+        job.status = 'cancelled'; db.session.commit()
     return "<h1>Payment Cancelled</h1><p>Your payment was not processed.</p>"
 
 @app.route('/payment/notify', methods=['POST'])
 def payment_notify():
-    print("Received ITN from PayFast"); return Response(status=200)
+    """PayFast ITN: verify, store once per pf_payment_id, acknowledge, and process in the background."""
+    fields = list(request.form.items(multi=True))
+    ok, reason = payfast.verify_itn(fields, passphrase=PAYFAST_PASSPHRASE, merchant_id=PAYFAST_MERCHANT_ID)
+    if not ok:
+        metrics.inc('payfast.itn.rejected')
+        print(f"WARN: Rejected PayFast ITN: {reason}")
+        return Response(status=400)
+
+    data = dict(fields)
+    job_id = data.get('m_payment_id', '')
+    notification = PaymentNotification(
+        pf_payment_id=data['pf_payment_id'],
+        job_id=int(job_id) if job_id.isdigit() else None,
+        payment_status=data.get('payment_status', ''),
+        amount_gross=payfast.parse_amount(data.get('amount_gross')),
+        payload=json.dumps(fields),
+    )
+    db.session.add(notification)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # PayFast retries until it gets a 200; the first copy is already being handled.
+        db.session.rollback()
+        metrics.inc('payfast.itn.duplicates')
+        return Response(status=200)
+
+    metrics.inc('payfast.itn.received')
+    background.submit(app, process_payment_notification, notification.id, fixer_portal_url())
+    return Response(status=200)
+
+def payment_link(job, amount):
+    """
+    Records the amount the client must pay for `job` (checked against the ITN)
+    and returns the signed PayFast checkout URL. Needs a request context; the caller commits.
+    """
+    job.amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+    fields = [
+        ('merchant_id', PAYFAST_MERCHANT_ID),
+        ('merchant_key', PAYFAST_MERCHANT_KEY),
+        ('return_url', url_for('payment_success', job_id=job.id, _external=True)),
+        ('cancel_url', url_for('payment_cancel', token=serializer.dumps(job.id, salt='payment-cancel'), _external=True)),
+        ('notify_url', url_for('payment_notify', _external=True)),
+        ('m_payment_id', str(job.id)),
+        ('amount', f"{job.amount:.2f}"),
+        ('item_name', f"FixMate-SA job #{job.id}"),
+    ]
+    return payfast.checkout_url(PAYFAST_URL, fields, PAYFAST_PASSPHRASE)
+
+def fixer_portal_url():
+    if has_request_context():
+        return url_for('fixer_login', _external=True)
+    return os.environ.get('FIXER_PORTAL_URL', '/fixer/login')
+
+def process_payment_notification(notification_id, portal_url):
+    """Marks the job paid and matches a fixer for one stored ITN. Safe to run more than once."""
+    notification = db.session.get(PaymentNotification, notification_id, with_for_update=True)
+    if notification is None or notification.status != 'received':
+        db.session.rollback(); return
+    job = db.session.get(Job, notification.job_id, with_for_update=True) if notification.job_id else None
+    matched_fixer = None
+    if notification.payment_status != 'COMPLETE':
+        notification.status = 'ignored'
+    elif job is None:
+        notification.status, notification.error = 'failed', 'unknown m_payment_id'
+    elif job.amount is None:
+        # The amount is set when the payment link is built (payment_link); without it nothing can be checked.
+        notification.status, notification.error = 'failed', 'job has no expected amount'
+    elif notification.amount_gross != job.amount:
+        notification.status, notification.error = 'failed', f'amount {notification.amount_gross} does not match job amount {job.amount}'
+    elif job.payment_status == 'paid':
+        notification.status = 'ignored'
+    else:
+        job.payment_status = 'paid'
+        matched_fixer = find_fixer_for_job(job)
+        if matched_fixer:
+            job.assigned_fixer, job.status = matched_fixer, 'assigned'
+        else:
+            job.status = 'paid_unassigned'
+        notification.status = 'processed'
+    notification.processed_at = datetime.now(timezone.utc)
+    db.session.commit()
+    metrics.inc(f"payfast.itn.{notification.status}")
+    if notification.error:
+        print(f"WARN: PayFast ITN {notification.pf_payment_id} failed: {notification.error}")
+    if matched_fixer:
+        send_whatsapp_message(to_number=matched_fixer.phone_number, message_body=f"New FixMate Job Alert!\n\nService Needed: {job.description}\nClient Contact: {job.client_contact_number}\n\nPlease go to your Fixer Portal to accept this job:\n{portal_url}")
 
 # --- Gemini-Powered Helper Functions ---
 from app.services import send_whatsapp_message
@@ -904,7 +1398,7 @@ def classify_service_request(service_description):
         return 'general handyman'
 
     try:
-        model = genai.GenerativeModel('models/gemini-1.5-flash')
+        model = gemini().GenerativeModel('models/gemini-1.5-flash')
 
         prompt = f"""
 You are a dispatcher for a South African home repair service.
@@ -939,50 +1433,6 @@ Required Skill:
         return 'general handyman'
 
 
-def get_or_create_user(phone_number):
-    """
-    Ensures the phone number is in WhatsApp format, then retrieves
-    the existing user or creates a new one.
-    """
-    if not phone_number.startswith("whatsapp:"):
-        phone_number = f"whatsapp:{phone_number}"
-
-    user = User.query.filter_by(phone_number=phone_number).first()
-    if not user:
-        user = User(phone_number=phone_number)
-        db.session.add(user)
-        db.session.commit()
-    return user
-
-
-def clear_user_state(user):
-    """
-    Resets the user's conversation state and clears any cached service request.
-    """
-    user.conversation_state = None
-    user.service_request_cache = None
-    db.session.commit()
-
-
-def find_fixer_for_job(service_description):
-    """
-    Finds an available fixer by first classifying the job using Gemini.
-    Falls back to a general handyman if no match is found.
-    """
-    skill_needed = classify_service_request(service_description)
-    fixer = (Fixer.query
-             .filter(Fixer.is_active == True,
-                     Fixer.skills.ilike(f'%{skill_needed}%'))
-             .first())
-    if fixer:
-        return fixer
-
-    return (Fixer.query
-            .filter(Fixer.is_active == True,
-                    Fixer.skills.ilike('%general%'))
-            .first())
-
-
 def get_quote_for_service(service_description):
     """
     Determines the quote price by first classifying the job using Gemini.
@@ -1009,205 +1459,18 @@ def whatsapp_webhook():
             return Response(status=200)
 
         # Ensure the webhook is a message and not some other event
-        if 'messages' in value:
-            message = value['messages'][0]
-            from_number = f"whatsapp:+{message['from']}"
-            user = get_or_create_user(from_number)
-
-            msg_type = message.get('type')
-            incoming_msg = ""
-            location = None
-
-            if msg_type == 'text':
-                incoming_msg = message['text']['body'].strip()
-
-            elif msg_type == 'audio':
-                audio_id = message['audio']['id']
-                media_info_url = f"https://waba-v2.360dialog.io/{audio_id}"
-                headers = {'D360-API-KEY': DIALOG_360_API_KEY}
-                print(f"DEBUG: Fetching media info from: {media_info_url}")
-
-                try:
-                    media_info_response = requests.get(media_info_url, headers=headers, timeout=10)
-                except requests.RequestException as e:
-                    print(f"Request failed: {e}")
-                    send_whatsapp_message(from_number, "Network issue. Couldn't process voice note.")
-                    return Response(status=200)
-
-                if media_info_response.status_code != 200:
-                    print(f"Error fetching media info: {media_info_response.status_code} - {media_info_response.text}")
-                    send_whatsapp_message(from_number, "Sorry, I couldn't process the voice note.")
-                    return Response(status=200)
-
-                try:
-                    media_info = media_info_response.json()
-                except json.JSONDecodeError:
-                    print("Error: Media info response is not valid JSON")
-                    send_whatsapp_message(from_number, "Sorry, I couldn't process the voice note.")
-                    return Response(status=200)
-
-                original_download_url = media_info.get('url')
-                if not original_download_url:
-                    print(f"Missing 'url' in media info: {media_info}")
-                    send_whatsapp_message(from_number, "An error occurred while getting the voice note.")
-                    return Response(status=200)
-
-                # Transform Facebook-hosted CDN URL to 360dialog proxy
-                download_url = original_download_url.replace(
-                    'https://lookaside.fbsbx.com',
-                    'https://waba-v2.360dialog.io'
-                )
-                print(f"DEBUG: Transformed download URL: {download_url}")
-
-                try:
-                    audio_content_response = requests.get(download_url, headers=headers, timeout=15)
-                except requests.RequestException as e:
-                    print(f"Audio download failed: {e}")
-                    send_whatsapp_message(from_number, "Sorry, I had trouble downloading the voice note.")
-                    return Response(status=200)
-
-                if audio_content_response.status_code == 200:
-                    audio_bytes = audio_content_response.content
-                    try:
-                        # Create a temporary file to store the audio
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.ogg') as temp_audio:
-                            temp_audio.write(audio_bytes)
-                            temp_audio_path = temp_audio.name
-
-                        # Pass the file path to transcription function
-                        incoming_msg = transcribe_audio(temp_audio_path)
-                        
-                        # Clean up the temporary file
-                        os.unlink(temp_audio_path)
-
-                        incoming_msg = transcribe_audio(audio_bytes)
-                        if not incoming_msg:
-                            send_whatsapp_message(from_number, "Sorry, I was unable to process your voice note.")
-                        elif "failed" in incoming_msg.lower():
-                            send_whatsapp_message(from_number, incoming_msg)
-                        else:
-                            response_message = (
-                                f"Welcome back {first_name} to FixMate-SA! To request a service, "
-                                "please describe what you need (e.g., 'Leaking pipe') or send a voice note."
-                            )
-                            set_user_state(user, 'awaiting_service_request')
-                            send_whatsapp_message(from_number, response_message)
-
-                    except Exception as e:
-                        print(f"Transcription error: {str(e)}")
-                        send_whatsapp_message(from_number, "Sorry, I couldn't process the audio message.")
-                else:
-                    print(f"Error downloading audio: {audio_content_response.status_code}")
-                    send_whatsapp_message(from_number, "Sorry, I had trouble downloading the voice note.")
-
-                return Response(status=200)
-
-            elif msg_type == 'location':
-                 location = message['location']
-
-            # --- Conversation State Machine ---
-            current_state = user.conversation_state
-            response_message = ""
-
-        # --- Post-Job States (Rating & Feedback) ---
-        if current_state == 'awaiting_rating':
-            job_id_str = get_user_cache(user).get('job_id')
-            job = db.session.get(Job, int(job_id_str)) if job_id_str else None
-            if job and incoming_msg.isdigit() and 1 <= int(incoming_msg) <= 5:
-                job.rating = int(incoming_msg)
-                db.session.commit()
-                response_message = (
-                    "Thank you for the rating! Could you please share a brief "
-                    "comment about your experience?"
-                )
-                set_user_state(user, 'awaiting_rating_comment',
-                               data={'job_id': job.id})
-            else:
-                response_message = "Thank you for your feedback!"
-                clear_user_state(user)
-
-        elif current_state == 'awaiting_rating_comment':
-            job_id_str = get_user_cache(user).get('job_id')
-            job = db.session.get(Job, int(job_id_str)) if job_id_str else None
-            if job:
-                job.rating_comment = incoming_msg
-                job.sentiment = analyze_feedback_sentiment(incoming_msg)
-                db.session.commit()
-            response_message = (
-                "Your feedback has been recorded. We appreciate you helping us improve FixMate-SA!"
-            )
-            clear_user_state(user)
-
-        # --- Job Request States ---
-        elif current_state == 'awaiting_location' and location:
-                user_name_greet = f"{user.full_name.split(' ')[0]}, " if user.full_name else ""
-                response_message = f"Thanks, {user_name_greet}I've got your location. Lastly, what's the best contact number for the fixer to use?"
-                set_user_state(user, 'awaiting_contact_number', data={'latitude': str(location.get('latitude')), 'longitude': str(location.get('longitude'))})
-
-        elif incoming_msg:
-            if current_state == 'awaiting_service_request':
-                response_message = "Got it. And what is your name?"
-                set_user_state(user, 'awaiting_name', data={'service': incoming_msg})
-
-            elif current_state == 'awaiting_name':
-                user.full_name = incoming_msg
-                db.session.commit()
-                first_name = user.full_name.split(' ')[0]
-                response_message = (
-                    f"Thanks, {first_name}! To help us find the nearest fixer, "
-                    "please share your location pin.\n\n"
-                    "Tap the paperclip icon 📎, then choose 'Location'."
-                )
-                set_user_state(user, 'awaiting_location')
-
-            elif current_state == 'awaiting_contact_number':
-                if any(char.isdigit() for char in incoming_msg) and len(incoming_msg) >= 10:
-                    terms_url = url_for('terms', _external=True)
-                    response_message = (
-                        "Great! We have all the details.\n\n"
-                        "By proceeding, you agree to the FixMate-SA Terms of Service.\n"
-                        f"View here: {terms_url}\n\n"
-                        "Reply *YES* to confirm and dispatch a fixer."
-                    )
-                    set_user_state(user, 'awaiting_terms_approval',
-                                   data={'contact': incoming_msg})
-                else:
-                    response_message = "That doesn't seem to be a valid phone number. Please try again."
-
-            elif current_state == 'awaiting_terms_approval':
-                if 'yes' in incoming_msg.lower():
-                    job_data = get_user_cache(user)
-                    job_id, fixer_found = create_new_job_in_db(user, job_data)
-                    if fixer_found:
-                        response_message = (
-                            f"Perfect! We have logged your request (Job #{job_id}) "
-                            "and have notified a nearby fixer. They will contact you shortly."
-                        )
-                    else:
-                        response_message = (
-                            f"Thank you. We have logged your request (Job #{job_id}), "
-                            "but all our fixers for this skill are currently busy. "
-                            "We will notify you as soon as one becomes available."
-                        )
-                    clear_user_state(user)
-                else:
-                    response_message = "Job request cancelled. Please say 'hello' to start a new request."
-                    clear_user_state(user)
+        if 'messages' not in value:
+            return Response(status=200)
 
-            else:
-                # Default / new conversation
-                clear_user_state(user)
-                first_name = f" {user.full_name.split(' ')[0]}" if user.full_name else ""
-                if incoming_msg.lower() in ['hi', 'hello', 'hallo', 'dumela',
-                                            'sawubona', 'molo', 'avuxeni', 'ndaa']:
-                    response_message = (
-                        f"Welcome back{first_name} to FixMate-SA! To request a service, "
-                        "please describe what you need (e.g., 'Leaking pipe') or send a voice note."
-                    )
-                    set_user_state(user, 'awaiting_service_request')
-                else:
-                        response_message = "Welcome back to FixMate-SA! To request a service, please describe what you need (e.g., 'leaking pipe,' 'hairdresser,' or 'any service')"
-                        set_user_state(user, 'awaiting_service_request')
+        message = value['messages'][0]
+        from_number = f"whatsapp:+{message['from']}"
+        user = get_or_create_user(from_number)
+
+        # Unit of work: the message is handled against an in-memory copy of the
+        # conversation state, and everything it changed is committed exactly once.
+        conversation = ConversationSession(user, ttl_seconds=CONVERSATION_TTL_HOURS * 3600)
+        response_message = handle_inbound_message(conversation, message, from_number)
+        conversation.commit()
 
         if response_message:
             send_whatsapp_message(from_number, response_message)
@@ -1218,7 +1481,219 @@ def whatsapp_webhook():
     return Response(status=200)
 
 
+def handle_inbound_message(conversation, message, from_number):
+    """
+    Runs one inbound message through the conversation state machine and returns
+    the reply to send, if any. Changes are only staged on the session; the
+    caller commits them once.
+    """
+    user = conversation.user
+    msg_type = message.get('type')
+    incoming_msg = ""
+    location = None
+
+    if msg_type == 'text':
+        incoming_msg = message['text']['body'].strip()
+
+    elif msg_type == 'audio':
+        import requests
+        audio_id = message['audio']['id']
+        media_info_url = f"https://waba-v2.360dialog.io/{audio_id}"
+        headers = {'D360-API-KEY': DIALOG_360_API_KEY}
+        print(f"DEBUG: Fetching media info from: {media_info_url}")
+
+        try:
+            media_info_response = requests.get(media_info_url, headers=headers, timeout=10)
+        except requests.RequestException as e:
+            print(f"Request failed: {e}")
+            send_whatsapp_message(from_number, "Network issue. Couldn't process voice note.")
+            return
+
+        if media_info_response.status_code != 200:
+            print(f"Error fetching media info: {media_info_response.status_code} - {media_info_response.text}")
+            send_whatsapp_message(from_number, "Sorry, I couldn't process the voice note.")
+            return
+
+        try:
+            media_info = media_info_response.json()
+        except json.JSONDecodeError:
+            print("Error: Media info response is not valid JSON")
+            send_whatsapp_message(from_number, "Sorry, I couldn't process the voice note.")
+            return
+
+        original_download_url = media_info.get('url')
+        if not original_download_url:
+            print(f"Missing 'url' in media info: {media_info}")
+            send_whatsapp_message(from_number, "An error occurred while getting the voice note.")
+            return
+
+        # Transform Facebook-hosted CDN URL to 360dialog proxy
+        download_url = original_download_url.replace(
+            'https://lookaside.fbsbx.com',
+            'https://waba-v2.360dialog.io'
+        )
+        print(f"DEBUG: Transformed download URL: {download_url}")
+
+        try:
+            audio_content_response = requests.get(download_url, headers=headers, timeout=15)
+        except requests.RequestException as e:
+            print(f"Audio download failed: {e}")
+            send_whatsapp_message(from_number, "Sorry, I had trouble downloading the voice note.")
+            return
+
+        if audio_content_response.status_code == 200:
+            audio_bytes = audio_content_response.content
+            try:
+                # Create a temporary file to store the audio
+                with tempfile.NamedTemporaryFile(delete=False, suffix='.ogg') as temp_audio:
+                    temp_audio.write(audio_bytes)
+                    temp_audio_path = temp_audio.name
+
+                # Pass the file path to transcription function
+                incoming_msg = transcribe_audio(temp_audio_path)
+
+                # Clean up the temporary file
+                os.unlink(temp_audio_path)
+
+                incoming_msg = transcribe_audio(audio_bytes)
+                if not incoming_msg:
+                    send_whatsapp_message(from_number, "Sorry, I was unable to process your voice note.")
+                elif "failed" in incoming_msg.lower():
+                    send_whatsapp_message(from_number, incoming_msg)
+                else:
+                    first_name = f" {user.full_name.split(' ')[0]}" if user.full_name else ""
+                    response_message = (
+                        f"Welcome back{first_name} to FixMate-SA! To request a service, "
+                        "please describe what you need (e.g., 'Leaking pipe') or send a voice note."
+                    )
+                    conversation.set_state('awaiting_service_request')
+                    return response_message
 
-    
+            except Exception as e:
+                print(f"Transcription error: {str(e)}")
+                send_whatsapp_message(from_number, "Sorry, I couldn't process the audio message.")
+        else:
+            print(f"Error downloading audio: {audio_content_response.status_code}")
+            send_whatsapp_message(from_number, "Sorry, I had trouble downloading the voice note.")
+
+        return
+
+    elif msg_type == 'location':
+         location = message['location']
+
+    # --- Conversation State Machine ---
+    ctx = MessageContext(conversation, from_number, text=incoming_msg, location=location)
+    return whatsapp_flow.dispatch(ctx)
+
+
+# --- WhatsApp Conversation Flow ---
+whatsapp_flow = ConversationMachine('whatsapp')
+
+# --- Post-Job States (Rating & Feedback) ---
+@whatsapp_flow.state('awaiting_rating', transitions=['awaiting_rating_comment', None])
+def handle_awaiting_rating(ctx):
+    conversation, incoming_msg = ctx.conversation, ctx.text
+    job_id_str = conversation.get('job_id')
+    job = db.session.get(Job, int(job_id_str)) if job_id_str else None
+    if job and incoming_msg.isdigit() and 1 <= int(incoming_msg) <= 5:
+        job.rating = int(incoming_msg)
+        conversation.set_state('awaiting_rating_comment',
+                               data={'job_id': job.id})
+        return (
+            "Thank you for the rating! Could you please share a brief "
+            "comment about your experience?"
+        )
+    conversation.clear()
+    return "Thank you for your feedback!"
+
+@whatsapp_flow.state('awaiting_rating_comment', transitions=[None])
+def handle_awaiting_rating_comment(ctx):
+    conversation, incoming_msg = ctx.conversation, ctx.text
+    job_id_str = conversation.get('job_id')
+    job = db.session.get(Job, int(job_id_str)) if job_id_str else None
+    if job:
+        job.rating_comment = incoming_msg
+        job.sentiment = analyze_feedback_sentiment(incoming_msg)
+    conversation.clear()
+    return "Your feedback has been recorded. We appreciate you helping us improve FixMate-SA!"
+
+# --- Job Request States ---
+@whatsapp_flow.state('awaiting_service_request', transitions=['awaiting_name'], accepts=has_text)
+def handle_awaiting_service_request(ctx):
+    ctx.conversation.set_state('awaiting_name', data={'service': ctx.text})
+    return "Got it. And what is your name?"
+
+@whatsapp_flow.state('awaiting_name', transitions=['awaiting_location'], accepts=has_text)
+def handle_awaiting_name(ctx):
+    user = ctx.conversation.user
+    user.full_name = ctx.text
+    first_name = user.full_name.split(' ')[0]
+    ctx.conversation.set_state('awaiting_location')
+    return (
+        f"Thanks, {first_name}! To help us find the nearest fixer, "
+        "please share your location pin.\n\n"
+        "Tap the paperclip icon 📎, then choose 'Location'."
+    )
+
+@whatsapp_flow.state('awaiting_location', transitions=['awaiting_contact_number'], accepts=has_location)
+def handle_awaiting_location(ctx):
+    user, location = ctx.conversation.user, ctx.location
+    user_name_greet = f"{user.full_name.split(' ')[0]}, " if user.full_name else ""
+    ctx.conversation.set_state('awaiting_contact_number', data={'latitude': str(location.get('latitude')), 'longitude': str(location.get('longitude'))})
+    return f"Thanks, {user_name_greet}I've got your location. Lastly, what's the best contact number for the fixer to use?"
+
+@whatsapp_flow.state('awaiting_contact_number', transitions=['awaiting_terms_approval'], accepts=has_text)
+def handle_awaiting_contact_number(ctx):
+    incoming_msg = ctx.text
+    if any(char.isdigit() for char in incoming_msg) and len(incoming_msg) >= 10:
+        terms_url = url_for('terms', _external=True)
+        ctx.conversation.set_state('awaiting_terms_approval',
+                                   data={'contact': incoming_msg})
+        return (
+            "Great! We have all the details.\n\n"
+            "By proceeding, you agree to the FixMate-SA Terms of Service.\n"
+            f"View here: {terms_url}\n\n"
+            "Reply *YES* to confirm and dispatch a fixer."
+        )
+    return "That doesn't seem to be a valid phone number. Please try again."
+
+@whatsapp_flow.state('awaiting_terms_approval', transitions=[None], accepts=has_text)
+def handle_awaiting_terms_approval(ctx):
+    conversation = ctx.conversation
+    if 'yes' not in ctx.text.lower():
+        conversation.clear()
+        return "Job request cancelled. Please say 'hello' to start a new request."
+
+    job_id, fixer_found = create_new_job_in_db(conversation.user, conversation.data)
+    conversation.clear()
+    if fixer_found:
+        return (
+            f"Perfect! We have logged your request (Job #{job_id}) "
+            "and have notified a nearby fixer. They will contact you shortly."
+        )
+    return (
+        f"Thank you. We have logged your request (Job #{job_id}), "
+        "but all our fixers for this skill are currently busy. "
+        "We will notify you as soon as one becomes available."
+    )
+
+# --- Default / new conversation ---
+@whatsapp_flow.default(transitions=['awaiting_service_request'], accepts=has_text)
+def handle_new_conversation(ctx):
+    conversation, incoming_msg = ctx.conversation, ctx.text
+    user = conversation.user
+    conversation.clear()
+    conversation.set_state('awaiting_service_request')
+    first_name = f" {user.full_name.split(' ')[0]}" if user.full_name else ""
+    if incoming_msg.lower() in ['hi', 'hello', 'hallo', 'dumela',
+                                'sawubona', 'molo', 'avuxeni', 'ndaa']:
+        return (
+            f"Welcome back{first_name} to FixMate-SA! To request a service, "
+            "please describe what you need (e.g., 'Leaking pipe') or send a voice note."
+        )
+    return "Welcome back to FixMate-SA! To request a service, please describe what you need (e.g., 'leaking pipe,' 'hairdresser,' or 'any service')"
 
+whatsapp_flow.validate()
 
+# --- NEW: Per-request and per-command SQL statistics (registered last so every CLI command is covered) ---
+query_stats.init_app(app)